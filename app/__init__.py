@@ -5,14 +5,17 @@ import logging
 from flask import Flask
 from dotenv import load_dotenv
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
 from flask_wtf import CSRFProtect
 from logging.handlers import RotatingFileHandler
 
 from config import Config
+from .snapshot import FileSnapshot
 
 load_dotenv()
 
 db = SQLAlchemy()
+migrate = Migrate()
 csrf = CSRFProtect()
 
 # Logging configuration
@@ -34,6 +37,14 @@ handler.setFormatter(formatter)
 
 # Add the handler to the logger
 logger.addHandler(handler)
+# alembic's logging config gives the root logger a console handler; keep
+# the app log in its file only
+logger.propagate = False
+
+
+def load_json(path: str):
+    with open(path) as file:
+        return json.load(file)
 
 
 def create_app(config=Config):
@@ -42,23 +53,69 @@ def create_app(config=Config):
     app.config.from_object(config)
 
     db.init_app(app)
+    migrate.init_app(app, db)
     csrf.init_app(app)
 
+    from . import metrics
+
+    metrics.init_app(app)
+
     from .main.routes import main
 
     app.register_blueprint(main)
 
+    from .commands import (
+        populate_command,
+        populate_sheet_command,
+        reconcile_sheet_command,
+        verify_pending_command,
+        rebuild_rollups_command,
+        reindex_members_command,
+        flw_stub_command,
+        webhooks_group,
+    )
+
+    app.cli.add_command(populate_command)
+    app.cli.add_command(populate_sheet_command)
+    app.cli.add_command(reconcile_sheet_command)
+    app.cli.add_command(verify_pending_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(reindex_members_command)
+    app.cli.add_command(flw_stub_command)
+    app.cli.add_command(webhooks_group)
+
+    # load page data once; reloaded only when the file or directory changes
+    bg_images = FileSnapshot(
+        os.path.join(app.static_folder, "images"),
+        lambda path: tuple(os.listdir(path)),
+    )
+    page_info = FileSnapshot("page_info.json", load_json)
+    bg_images.get()
+    page_info.get()
+
     # choose background image
     @app.context_processor
     def choose_bg():
-        images = os.listdir(os.path.join(app.static_folder, "images"))
-        return {"bg_img": random.choice(images)}
+        return {"bg_img": random.choice(bg_images.get())}
 
     # add page info
     @app.context_processor
     def add_page_info():
-        with open("page_info.json") as page_file:
-            page_data = json.load(page_file)
-            return {"page_info": page_data}
+        return {"page_info": page_info.get()}
 
     return app
+
+
+def start_workers(app):
+    # start the background workers in a process that serves requests. cli
+    # commands and the reloader's parent process create apps too, but must
+    # not sync sheets or settle payments.
+    if not app.config["BACKGROUND_WORKERS"]:
+        return
+    from .main.sheet_sync import sync_worker
+    from .main.payments import webhook_worker
+    from .main.verifier import verifier_worker
+
+    sync_worker.start(app, interval=app.config["SHEET_SYNC_INTERVAL"])
+    webhook_worker.start(app, interval=app.config["WEBHOOK_INTERVAL"])
+    verifier_worker.start(app, interval=app.config["VERIFY_INTERVAL"])
@@ -0,0 +1,132 @@
+# python imports
+import json
+
+# installed imports
+import click
+from flask.cli import AppGroup
+
+# local imports
+from app import logger
+
+
+@click.command("populate")
+@click.option("--force", is_flag=True, help="Reload the roster even if members exist.")
+def populate_command(force):
+    """Load db.tsv into the member table and rebuild the sheets if it changed."""
+    from .main.functions import populate_db
+
+    populate_db(force=force)
+    logger.info("Populate command finished")
+
+
+@click.command("populate-sheet")
+@click.option("--fee-type", default="fusion-cantus", show_default=True)
+def populate_sheet_command(fee_type):
+    """Rewrite every part worksheet from the database."""
+    from .main.functions import populate_sheet
+
+    populate_sheet(fee_type=fee_type)
+    logger.info(f"Populated {fee_type} sheet")
+
+
+@click.command("reconcile-sheet")
+@click.option("--fee-type", default="fusion-cantus", show_default=True)
+@click.option("--dry-run", is_flag=True, help="Report differences without writing.")
+def reconcile_sheet_command(fee_type, dry_run):
+    """Fix "Paid" cells in the part worksheets that differ from the database."""
+    from .main.functions import reconcile_sheet
+
+    report = reconcile_sheet(fee_type=fee_type, dry_run=dry_run)
+    for sheetname, result in report.items():
+        if "skipped" in result:
+            click.echo(f"{sheetname}: skipped, {result['skipped']}")
+            continue
+        click.echo(
+            f"{sheetname}: {len(result['mismatched'])} mismatched, "
+            f"{len(result['missing'])} missing, {len(result['unknown'])} not in db"
+        )
+        for row in result["mismatched"]:
+            click.echo(
+                f"  row {row['row']} {row['name']}: sheet {row['sheet']!r}, db {row['db']}"
+            )
+        for name in result["missing"]:
+            click.echo(f"  missing from sheet: {name}")
+        for name in result["unknown"]:
+            click.echo(f"  not in db: {name}")
+    if dry_run:
+        logger.info("Dry run, nothing written")
+
+
+@click.command("verify-pending")
+def verify_pending_command():
+    """Verify stale pending transactions with flutterwave and settle them."""
+    from .main.verifier import verify_pending
+
+    totals = verify_pending()
+    click.echo(", ".join(f"{count} {key}" for key, count in totals.items()))
+
+
+@click.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recompute the dashboard payment rollups from the transactions."""
+    from .main.rollups import rebuild_rollups
+
+    count = rebuild_rollups()
+    click.echo(f"{count} rollups rebuilt")
+
+
+@click.command("reindex-members")
+def reindex_members_command():
+    """Rebuild the member name search index."""
+    from app import db
+    from .main.search import index_members
+
+    count = index_members()
+    db.session.commit()
+    click.echo(f"{count} members indexed")
+
+
+@click.command("flw-stub")
+@click.option("--port", default=8765, show_default=True)
+@click.option("--file", "path", help="JSON list of transactions to serve.")
+def flw_stub_command(port, path):
+    """Serve a local stand-in for the flutterwave verify endpoints."""
+    from .main.flutterwave_stub import create_stub_app, load_transactions
+
+    stub = create_stub_app(load_transactions(path) if path else None)
+    logger.info(f"Flutterwave stub on port {port}")
+    stub.run(host="127.0.0.1", port=port)
+
+
+webhooks_group = AppGroup("webhooks", help="Search and replay the webhook journal.")
+
+
+@webhooks_group.command("search")
+@click.argument("tx_ref")
+@click.option("--day", help="Only read the segment for this day (YYYY-MM-DD).")
+def search_webhooks_command(tx_ref, day):
+    """Print every journaled delivery for TX_REF."""
+    from .main.journal import search_journal
+
+    entries = search_journal(tx_ref, day=day)
+    for entry in entries:
+        click.echo(json.dumps(entry))
+    logger.info(f"Found {len(entries)} deliveries for {tx_ref}")
+
+
+@webhooks_group.command("replay")
+@click.argument("tx_ref")
+@click.option("--day", help="Only read the segment for this day (YYYY-MM-DD).")
+def replay_webhooks_command(tx_ref, day):
+    """Queue the journaled deliveries for TX_REF and settle them."""
+    from .models import WebhookEvents
+    from .main.journal import search_journal
+    from .main.payments import process_webhooks
+
+    entries = search_journal(tx_ref, day=day)
+    for entry in entries:
+        WebhookEvents(json.dumps(entry["payload"])).insert()
+    # settlement is idempotent, so replaying a settled delivery is harmless
+    while process_webhooks():
+        pass
+    logger.info(f"Replayed {len(entries)} deliveries for {tx_ref}")
@@ -0,0 +1,156 @@
+# python imports
+import io
+import csv
+import tempfile
+from datetime import datetime, timedelta
+
+# installed imports
+import openpyxl
+
+# local imports
+from app import db
+from app.models import Transactions, Members
+
+# rows fetched per round trip; the db driver streams them with a
+# server-side cursor instead of loading the whole result
+EXPORT_YIELD_PER = 1000
+# bytes per chunk written to the response
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+TRANSACTION_COLUMNS = [
+    "Date",
+    "Tx Ref",
+    "Status",
+    "Fee Type",
+    "Part",
+    "Name",
+    "Phone No",
+    "Amount",
+    "Donation",
+    "Flutterwave ID",
+    "Flutterwave Ref",
+]
+BALANCE_COLUMNS = ["Name", "Part", "Phone No", "Payments", "Paid"]
+
+
+def export_filters(args):
+    # fee_type, part and a start/end date range (YYYY-MM-DD, end inclusive).
+    # raises ValueError for malformed dates.
+    filters = {
+        "fee_type": args.get("fee_type") or None,
+        "part": (args.get("part") or "").lower() or None,
+        "status": args.get("status") or None,
+        "start": None,
+        "end": None,
+    }
+    if args.get("start"):
+        filters["start"] = datetime.strptime(args["start"], "%Y-%m-%d")
+    if args.get("end"):
+        filters["end"] = datetime.strptime(args["end"], "%Y-%m-%d") + timedelta(
+            days=1
+        )
+    return filters
+
+
+def transaction_conditions(filters: dict):
+    conditions = []
+    if filters["fee_type"]:
+        conditions.append(Transactions.fee_type == filters["fee_type"])
+    if filters["start"]:
+        conditions.append(Transactions.created_at >= filters["start"])
+    if filters["end"]:
+        conditions.append(Transactions.created_at < filters["end"])
+    return conditions
+
+
+def transaction_rows(filters: dict):
+    yield TRANSACTION_COLUMNS
+    query = (
+        db.select(
+            Transactions.created_at,
+            Transactions.tx_ref,
+            Transactions.status,
+            Transactions.fee_type,
+            Transactions.part,
+            Members.name,
+            Members.phone_no,
+            Transactions.amount,
+            Transactions.donation,
+            Transactions.flw_tx_id,
+            Transactions.flw_tx_ref,
+        )
+        .outerjoin(Members, Transactions.member_id == Members.id)
+        .where(*transaction_conditions(filters))
+        .order_by(Transactions.id)
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+    if filters["part"]:
+        query = query.where(db.func.lower(Transactions.part) == filters["part"])
+    if filters["status"]:
+        query = query.where(Transactions.status == filters["status"])
+    for row in db.session.execute(query):
+        yield [row[0].strftime("%Y-%m-%d %H:%M:%S"), *row[1:]]
+
+
+def balance_rows(filters: dict):
+    # every member with the total of their completed payments in the range
+    yield BALANCE_COLUMNS
+    paid = (
+        db.select(
+            Transactions.member_id,
+            db.func.count().label("payments"),
+            db.func.sum(Transactions.amount).label("paid"),
+        )
+        .where(
+            Transactions.member_id.isnot(None),
+            Transactions.status == "completed",
+            *transaction_conditions(filters),
+        )
+        .group_by(Transactions.member_id)
+        .subquery()
+    )
+    query = (
+        db.select(
+            Members.name,
+            Members.part,
+            Members.phone_no,
+            db.func.coalesce(paid.c.payments, 0),
+            db.func.coalesce(paid.c.paid, 0),
+        )
+        .outerjoin(paid, paid.c.member_id == Members.id)
+        .order_by(Members.part, Members.name)
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+    if filters["part"]:
+        query = query.where(Members.part == filters["part"])
+    for row in db.session.execute(query):
+        yield list(row)
+
+
+def csv_stream(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def xlsx_stream(rows, title: str):
+    # write-only workbooks keep rows in a temporary file rather than memory.
+    # an xlsx is a zip, so it is sent once complete, a chunk at a time.
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    for row in rows:
+        sheet.append(row)
+    with tempfile.TemporaryFile() as file:
+        workbook.save(file)
+        file.seek(0)
+        while True:
+            chunk = file.read(EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,118 @@
+# python imports
+import os
+
+# installed imports
+import requests
+from dotenv import load_dotenv
+from urllib3.util.retry import Retry
+
+# local imports
+from app import logger
+from app.metrics import InstrumentedAdapter
+from .sheet_cache import TTLCache
+
+load_dotenv()
+
+RAVE_SEC_KEY = os.getenv("RAVE_SECRET_KEY")
+FLW_API_URL = os.getenv("FLW_API_URL", "https://api.flutterwave.com/v3")
+# (connect, read) timeouts in seconds
+FLW_TIMEOUT = (
+    float(os.getenv("FLW_CONNECT_TIMEOUT", 3.05)),
+    float(os.getenv("FLW_READ_TIMEOUT", 10)),
+)
+# the payer's browser waits on callback verification, so it gets one short try
+FLW_CALLBACK_TIMEOUT = (
+    float(os.getenv("FLW_CONNECT_TIMEOUT", 3.05)),
+    float(os.getenv("FLW_CALLBACK_READ_TIMEOUT", 4)),
+)
+FLW_RETRIES = int(os.getenv("FLW_RETRIES", 3))
+FLW_POOL_SIZE = int(os.getenv("FLW_POOL_SIZE", 10))
+
+# successful verifications, keyed by flutterwave transaction id. the callback
+# and the webhook usually verify the same payment within seconds of each other.
+verified = TTLCache(ttl=float(os.getenv("FLW_VERIFY_CACHE_TTL", 300)), maxsize=1024)
+
+
+def make_session(retries: int = FLW_RETRIES):
+    # keep-alive connection pool. GET is idempotent, so connection errors,
+    # 429 and 5xx responses are retried with exponential backoff.
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = InstrumentedAdapter(
+        "flutterwave",
+        pool_connections=1,
+        pool_maxsize=FLW_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(
+        {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {RAVE_SEC_KEY}",
+        }
+    )
+    return session
+
+
+session = make_session()
+callback_session = make_session(retries=0)
+
+
+def verify_transaction(flw_tx_id, fast=False):
+    # returns the verify response body, or None when flutterwave rejects the id.
+    # raises requests.RequestException when flutterwave can't be reached.
+    # fast makes a single short attempt, for callers that can retry later.
+    flw_tx_id = int(flw_tx_id)
+    data = verified.get(flw_tx_id)
+    if data is not None:
+        logger.info(f"USING CACHED VERIFICATION FOR {flw_tx_id}")
+        return data
+
+    response = (callback_session if fast else session).get(
+        f"{FLW_API_URL}/transactions/{flw_tx_id}/verify",
+        timeout=FLW_CALLBACK_TIMEOUT if fast else FLW_TIMEOUT,
+    )
+    if response.status_code >= 500 or response.status_code == 429:
+        response.raise_for_status()
+    if response.status_code != 200:
+        logger.info(f"VERIFICATION FAILED FOR {flw_tx_id}: {response.status_code}")
+        return None
+
+    data = response.json()
+    # a pending or failed payment can still change, so only cache paid ones
+    if data["status"] == "success" and data["data"].get("status") == "successful":
+        verified.set(flw_tx_id, data)
+    return data
+
+
+def is_paid(data: dict, tx_ref: str):
+    # a verify response for a completed payment of this checkout. the request
+    # succeeding only means flutterwave found the transaction.
+    if not data or data.get("status") != "success":
+        return False
+    payment = data.get("data") or {}
+    return payment.get("status") == "successful" and payment.get("tx_ref") == tx_ref
+
+
+def verify_by_reference(tx_ref: str):
+    # like verify_transaction, but looks the payment up by our tx_ref. used
+    # for checkouts whose flutterwave transaction id never reached us.
+    response = session.get(
+        f"{FLW_API_URL}/transactions/verify_by_reference",
+        params={"tx_ref": tx_ref},
+        timeout=FLW_TIMEOUT,
+    )
+    if response.status_code >= 500 or response.status_code == 429:
+        response.raise_for_status()
+    if response.status_code != 200:
+        logger.info(f"NO FLUTTERWAVE TRANSACTION FOR {tx_ref}: {response.status_code}")
+        return None
+    return response.json()
@@ -0,0 +1,71 @@
+# python imports
+import json
+import itertools
+import threading
+
+# installed imports
+from flask import Flask, request, jsonify
+
+
+# stand-in for the flutterwave verify endpoints, so the payment flows can be
+# run offline. serve it with `flask --app run flw-stub` and point
+# FLW_API_URL at http://127.0.0.1:<port>/v3.
+def create_stub_app(transactions: list = None):
+    app = Flask("flutterwave-stub")
+    ids = itertools.count(1000)
+    lock = threading.Lock()
+    by_ref = {}
+
+    def add(transaction: dict):
+        with lock:
+            record = {
+                "id": transaction.get("id") or next(ids),
+                "tx_ref": transaction["tx_ref"],
+                "flw_ref": transaction.get("flw_ref")
+                or f"FLW-STUB-{transaction['tx_ref']}",
+                "amount": transaction.get("amount", 0),
+                "currency": transaction.get("currency", "NGN"),
+                "status": transaction.get("status", "successful"),
+                "customer": transaction.get("customer") or {"name": ""},
+                "meta": transaction.get("meta") or {},
+            }
+            by_ref[record["tx_ref"]] = record
+        return record
+
+    def found(record):
+        if record is None:
+            return (
+                jsonify(
+                    status="error",
+                    message="No transaction was found for this id",
+                    data=None,
+                ),
+                400,
+            )
+        return jsonify(
+            status="success", message="Transaction fetched successfully", data=record
+        )
+
+    for transaction in transactions or []:
+        add(transaction)
+
+    @app.get("/v3/transactions/<int:flw_tx_id>/verify")
+    def verify(flw_tx_id):
+        records = [r for r in by_ref.values() if r["id"] == flw_tx_id]
+        return found(records[0] if records else None)
+
+    @app.get("/v3/transactions/verify_by_reference")
+    def verify_by_reference():
+        return found(by_ref.get(request.args.get("tx_ref")))
+
+    # not part of the flutterwave api: record a payment to be verified later
+    @app.post("/v3/stub/transactions")
+    def add_transaction():
+        return jsonify(status="success", data=add(request.get_json())), 201
+
+    return app
+
+
+def load_transactions(path: str):
+    with open(path) as file:
+        return json.load(file)
@@ -2,45 +2,50 @@
 import os
 import json
 import string
-import tempfile
+from datetime import datetime, date, time
 
 # installed imports
 import gspread
-import pandas as pd
+import openpyxl
 from dotenv import load_dotenv
 from werkzeug.datastructures import FileStorage
-from oauth2client.service_account import ServiceAccountCredentials
 
 # local imports
-from app import logger
-from app.models import Members
+from app import db, logger
+from app.models import Members, SheetUpdates
+from .sheet_cache import sheet_cache, sort_key, WorksheetRows
+from .sheet_backend import get_backend
+from .sheet_quota import BULK, sheet_priority
+from .roster import load_roster
 
 load_dotenv()
 
-ACCEPTED_SHEETNAMES = ["Soprano", "Alto", "Tenor", "Bass", "Donations"]
+PART_SHEETNAMES = ["Soprano", "Alto", "Tenor", "Bass"]
+ACCEPTED_SHEETNAMES = PART_SHEETNAMES + ["Donations"]
+# columns an uploaded sheet must have; "*" applies to the part sheets
+REQUIRED_COLUMNS = {"Donations": ["Name", "Paid"], "*": ["Name", "Phone No", "Paid"]}
+# cells per values_batch_update call, well under the api request size limit
+BATCH_CELL_LIMIT = 20000
+# reloads of a worksheet whose rows moved before update_cells gives up
+UPDATE_CELLS_ATTEMPTS = 2
 
 spreadsheet_id = os.getenv("SPREADSHEET_ID")
-google_credentials_file = json.loads(os.getenv("CREDENTIALS_FILE"), strict=False)
 
-# Set up the scope for accessing Google Sheets
-scope = [
-    "https://spreadsheets.google.com/feeds",
-    "https://www.googleapis.com/auth/drive",
-]
-# Authenticate with Google Sheets
-creds = ServiceAccountCredentials.from_json_keyfile_dict(google_credentials_file, scope)
-gclient = gspread.authorize(creds)
+# sheet IDs per fee type, read from sheets.json on first use
+sheets = None
 
-# get sheet IDs
-with open("sheets.json") as sheets_data:
-    sheets = json.load(sheets_data)["sheets"]
 
+def get_sheet_id(fee_type: str):
+    global sheets
+    if sheets is None:
+        # get sheet IDs
+        with open("sheets.json") as sheets_data:
+            sheets = json.load(sheets_data)["sheets"]
+    return sheets.get(fee_type)
 
-def get_last_column_letter(sheet):
-    # Get all values in the first row (headers)
-    header_row = sheet.row_values(1)
 
-    # Find the index of the last non-empty cell in the first row
+def get_last_column_letter(header_row: list):
+    # Find the index of the last non-empty cell in the header row
     last_non_empty_index = (
         len(header_row)
         - header_row[::-1].index(next(filter(None, reversed(header_row))))
@@ -53,6 +58,72 @@ def get_last_column_letter(sheet):
     return last_column_letter
 
 
+def get_spreadsheet(fee_type: str):
+    spreadsheet = sheet_cache.get(("spreadsheet", fee_type))
+    if spreadsheet is None:
+        spreadsheet = sheet_cache.set(
+            ("spreadsheet", fee_type),
+            get_backend().open(get_sheet_id(fee_type)),
+        )
+    return spreadsheet
+
+
+def get_worksheet(fee_type: str, sheetname: str):
+    worksheets = sheet_cache.get(("worksheets", fee_type))
+    if worksheets is None:
+        worksheets = sheet_cache.set(
+            ("worksheets", fee_type),
+            {
+                worksheet.title: worksheet
+                for worksheet in get_spreadsheet(fee_type).worksheets()
+            },
+        )
+    if sheetname in worksheets:
+        return worksheets[sheetname]
+    worksheet = get_spreadsheet(fee_type).add_worksheet(sheetname, rows=100, cols=20)
+    invalidate_worksheet(fee_type, sheetname)
+    return worksheet
+
+
+def invalidate_worksheet(fee_type: str, sheetname: str):
+    sheet_cache.pop(("worksheets", fee_type))
+    sheet_cache.pop(("header", fee_type, sheetname))
+    sheet_cache.pop(("rows", fee_type, sheetname))
+
+
+def get_rows(fee_type: str, sheetname: str, worksheet=None) -> WorksheetRows:
+    rows = sheet_cache.get(("rows", fee_type, sheetname))
+    if rows is None:
+        worksheet = worksheet or get_worksheet(fee_type, sheetname)
+        rows = sheet_cache.set(
+            ("rows", fee_type, sheetname), WorksheetRows(worksheet.get_all_values())
+        )
+        sheet_cache.set(("header", fee_type, sheetname), list(rows.header))
+    return rows
+
+
+def get_header(fee_type: str, sheetname: str, worksheet=None):
+    header = sheet_cache.get(("header", fee_type, sheetname))
+    if header is None:
+        worksheet = worksheet or get_worksheet(fee_type, sheetname)
+        header = sheet_cache.set(
+            ("header", fee_type, sheetname), worksheet.row_values(1)
+        )
+    return header
+
+
+def set_header(fee_type: str, sheetname: str, header: list, worksheet=None):
+    worksheet = worksheet or get_worksheet(fee_type, sheetname)
+    logger.info(f"Updating Header: {header}")
+    worksheet.update("A1", [header])
+    cache_header(fee_type, sheetname, header)
+
+
+def cache_header(fee_type: str, sheetname: str, header: list):
+    sheet_cache.set(("header", fee_type, sheetname), list(header))
+    sheet_cache.pop(("rows", fee_type, sheetname))
+
+
 def add_record(
     data: dict,
     sheetname: str,
@@ -61,45 +132,109 @@ def add_record(
     sort_column: str = "Name",
     donation=False,
 ):
-    spreadsheet = gclient.open_by_key(sheets.get(fee_type))
-    # Get worksheet
-    if sheetname not in [worksheet.title for worksheet in spreadsheet.worksheets()]:
-        worksheet = spreadsheet.add_worksheet(sheetname, rows=100, cols=20)
-    else:
-        worksheet = spreadsheet.worksheet(sheetname)
+    return bool(
+        add_records(
+            [data],
+            sheetname=sheetname,
+            fee_type=fee_type,
+            check_column=check_column,
+            sort_column=sort_column,
+            donation=donation,
+        )
+    )
+
+
+def add_records(
+    records: list,
+    sheetname: str,
+    fee_type: str,
+    check_column: str = "Phone No",
+    sort_column: str = "Name",
+    donation=False,
+):
+    worksheet = get_worksheet(fee_type, sheetname)
 
     # Get headers
-    header_row = worksheet.row_values(1)
-    header = list(data.keys())
+    header_row = get_header(fee_type, sheetname, worksheet)
+    header = list(records[0].keys())
 
     # Update header row if needed
     if header_row != header:
-        logger.info(f"Updating header")
-        worksheet.update("A1", [header])
-
-    if not donation:
-        # Get all values in the specified check column
-        check_column_values = worksheet.col_values(header.index(check_column) + 1)
-
-        # Check if the specified value in the input data is already in the check column
-        if data[check_column] in check_column_values:
-            logger.info(
-                f"Record with '{check_column}' equal to '{data[check_column]}' already exists."
-            )
-            return False
-
-    # Append the row to the worksheet
-    values = list(data.values())
-    worksheet.append_row(values)
-
-    # Sort the rows alphabetically based on the specified sort column
-    sort_column_index = header.index(sort_column) + 1
-    last_column_letter = get_last_column_letter(worksheet)
-    last_row_index = worksheet.row_count
-    worksheet.sort(
-        (sort_column_index, "asc"), range=f"A2:{last_column_letter}{last_row_index}"
+        set_header(fee_type, sheetname, header, worksheet)
+
+    rows = get_rows(fee_type, sheetname, worksheet)
+    with rows.lock:
+        if not donation:
+            # Skip records whose check value is already in the check column
+            new_records = []
+            seen = set()
+            for data in records:
+                if data[check_column] in seen or rows.find(
+                    check_column, data[check_column]
+                ):
+                    logger.info(
+                        f"Record with '{check_column}' equal to '{data[check_column]}' already exists."
+                    )
+                    continue
+                seen.add(data[check_column])
+                new_records.append(data)
+            records = new_records
+            if not records:
+                return 0
+
+        # Insert each row where it keeps the sheet sorted by the sort column,
+        # instead of appending and sorting the whole sheet
+        for data in records:
+            values = list(data.values())
+            row_index = rows.sorted_position(sort_column, data[sort_column])
+            worksheet.insert_row(values, index=row_index)
+            rows.insert(row_index, values)
+
+    return len(records)
+
+
+@sheet_priority(BULK)
+def sort_worksheet(fee_type: str, sheetname: str, sort_column: str = "Name"):
+    # full server side sort of the data rows. writes keep worksheets sorted,
+    # so this is only a deferred compaction step after bulk uploads or edits.
+    # it may run in a process whose mirror predates the upload, so the rows
+    # are read afresh.
+    worksheet = get_worksheet(fee_type, sheetname)
+    sheet_cache.pop(("rows", fee_type, sheetname))
+    rows = get_rows(fee_type, sheetname, worksheet)
+    if rows.column_index(sort_column) is None:
+        logger.info(f"Column '{sort_column}' not found.")
+        return
+    with rows.lock:
+        sort_column_index = rows.column_index(sort_column) + 1
+        last_column_letter = get_last_column_letter(rows.header)
+        last_row_index = max(len(rows), 2)
+        worksheet.sort(
+            (sort_column_index, "asc"), range=f"A2:{last_column_letter}{last_row_index}"
+        )
+        rows.sort(sort_column)
+
+
+def rows_match(worksheet, rows: WorksheetRows, located: set):
+    # re-read the identifier cells the mirror located and check that each
+    # still holds the same identifier. rows move when the sheet is sorted or
+    # rewritten by another process or by hand.
+    located = sorted(located)
+    ranges = [
+        gspread.utils.absolute_range_name(
+            worksheet.title,
+            gspread.utils.rowcol_to_a1(row_index, rows.column_index(identify_col) + 1),
+        )
+        for identify_col, row_index in located
+    ]
+    value_ranges = worksheet.spreadsheet.values_batch_get(ranges).get(
+        "valueRanges", []
     )
-
+    for (identify_col, row_index), value_range in zip(located, value_ranges):
+        values = value_range.get("values", [])
+        value = values[0][0] if values and values[0] else ""
+        if str(value) != rows.get(row_index, identify_col):
+            return False
     return True
 
 
@@ -112,146 +247,360 @@ def find_and_replace(
     sheetname: str,
     replace = True,
 ):
-    spreadsheet = gclient.open_by_key(sheets.get(fee_type))
-    # Get worksheet
-    if sheetname not in [worksheet.title for worksheet in spreadsheet.worksheets()]:
-        worksheet = spreadsheet.add_worksheet(sheetname, rows=100, cols=20)
-    else:
-        worksheet = spreadsheet.worksheet(sheetname)
-    # Get headers (assumes headers are in the first row)
-    headers = worksheet.row_values(1)
-
-    if column_name not in headers:
-        logger.info(f"Column '{column_name}' not found.")
-        return
-    # Find the index of the specified column
-    column_index = headers.index(column_name) + 1
-    # Get all values in the specified row identifier column
-    identifier_column_values = worksheet.col_values(headers.index(identify_col) + 1)
-
-    if identify_value not in identifier_column_values:
-        logger.info(f"Row with '{identify_col}' equal to '{identify_value}' not found.")
-        return
-    # Find the row index where the row_identifier_value is located
-    row_index = identifier_column_values.index(identify_value) + 1
-
-    # Get the current value of the cell
-    current_value = worksheet.cell(row_index, column_index).value
+    results = update_cells(
+        fee_type,
+        sheetname,
+        [
+            {
+                "identify_col": identify_col,
+                "identify_value": identify_value,
+                "column_name": column_name,
+                "value": new_value,
+                "replace": replace,
+            }
+        ],
+    )
+    return results[0] if results else None
+
+
+def update_cells(fee_type: str, sheetname: str, updates: list):
+    # apply several find_and_replace style updates with a single write. the
+    # rows they land on come from the mirror, so the identifier cells are
+    # read back first; if any moved, or an identifier is missing because
+    # the row was added since, the mirror is reloaded and the updates are
+    # located again.
+    worksheet = get_worksheet(fee_type, sheetname)
+    for attempt in range(UPDATE_CELLS_ATTEMPTS):
+        rows = get_rows(fee_type, sheetname, worksheet)
+        with rows.lock:
+            final = attempt == UPDATE_CELLS_ATTEMPTS - 1
+            results = write_cells(rows, updates, worksheet, final)
+            if results is not None:
+                return results
+        logger.info(f"Rows in {sheetname} changed since they were read; reloading")
+        sheet_cache.pop(("rows", fee_type, sheetname))
+    raise Exception(f"Rows in {sheetname} kept moving, updates not written")
+
+
+def write_cells(rows: WorksheetRows, updates: list, worksheet, final=True):
+    # write the updates if the rows they were found on are still in place.
+    # returns the new cell values, or None when the mirror is out of date.
+    # identifiers missing from the mirror only count as not found when
+    # `final`, otherwise the mirror may just predate their rows.
+    changed = {}  # (row index, column name) -> new value
+    located = set()  # (identify column, row index)
+    results = []
+    for update in updates:
+        identify_col = update["identify_col"]
+        identify_value = update["identify_value"]
+        column_name = update["column_name"]
+        if rows.column_index(column_name) is None:
+            logger.info(f"Column '{column_name}' not found.")
+            results.append(None)
+            continue
+        row_index = rows.find(identify_col, identify_value)
+        if row_index is None:
+            if not final:
+                return None
+            logger.info(
+                f"Row with '{identify_col}' equal to '{identify_value}' not found."
+            )
+            results.append(None)
+            continue
 
-    # Replace the value in the specified cell
-    total_value = int(new_value) + int(current_value) if not replace else int(new_value)
-    worksheet.update_cell(row_index, column_index, total_value)
-    return total_value
+        # Get the current value of the cell, including earlier updates in this batch
+        current_value = changed.get(
+            (row_index, column_name), rows.get(row_index, column_name)
+        )
+        total_value = (
+            int(update["value"]) + int(current_value or 0)
+            if not update.get("replace", True)
+            else int(update["value"])
+        )
+        changed[(row_index, column_name)] = total_value
+        located.add((identify_col, row_index))
+        results.append(total_value)
+
+    if changed:
+        if not rows_match(worksheet, rows, located):
+            return None
+        worksheet.batch_update(
+            [
+                {
+                    "range": gspread.utils.rowcol_to_a1(
+                        row_index, rows.column_index(column_name) + 1
+                    ),
+                    "values": [[value]],
+                }
+                for (row_index, column_name), value in changed.items()
+            ]
+        )
+        for (row_index, column_name), value in changed.items():
+            rows.set(row_index, column_name, value)
+    return results
 
 
 def get_data_from_worksheet(sheetname: str, fee_type: str):
-    spreadsheet = gclient.open_by_key(sheets.get(fee_type))
-    if sheetname not in [worksheet.title for worksheet in spreadsheet.worksheets()]:
-        worksheet = spreadsheet.add_worksheet(sheetname, rows=100, cols=20)
-    else:
-        worksheet = spreadsheet.worksheet(sheetname)
+    rows = get_rows(fee_type, sheetname)
 
-    data_range = worksheet.get_all_values()[1:]  # Exclude the header row
+    data_range = rows.rows[1:]  # Exclude the header row
     data = [(row[0], row[1]) for row in data_range]
 
     return data
 
 
+def cell_value(value):
+    # uploaded cells as json friendly sheet values; blanks become 0 as before
+    if value is None:
+        return 0
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def read_upload_headers(workbook):
+    # validate every accepted sheet before anything is cleared.
+    # returns {sheetname: (header, number of data rows)}
+    layouts = {}
+    for sheetname in workbook.sheetnames:
+        if sheetname not in ACCEPTED_SHEETNAMES:
+            continue
+        rows = workbook[sheetname].iter_rows(values_only=True)
+        header = list(next(rows, None) or [])
+        while header and header[-1] is None:
+            header.pop()
+        if None in header:
+            raise ValueError(f"Sheet '{sheetname}' has a blank column header")
+        header = [str(column) for column in header]
+        missing = [
+            column
+            for column in REQUIRED_COLUMNS.get(sheetname, REQUIRED_COLUMNS["*"])
+            if column not in header
+        ]
+        if missing:
+            raise ValueError(f"Sheet '{sheetname}' is missing columns: {missing}")
+        row_count = sum(1 for row in rows if any(value is not None for value in row))
+        layouts[sheetname] = (header, row_count)
+    if not layouts:
+        raise ValueError(f"No sheets named any of {ACCEPTED_SHEETNAMES} in upload")
+    return layouts
+
+
+@sheet_priority(BULK)
 def file_upload(namefile: FileStorage, fee_type: str):
     logger.info("POPULATING SPREADSHEET WITH UPLOADED FILE")
     logger.info(f"FILE: {namefile}")
-    spreadsheet = gclient.open_by_key(sheets.get(fee_type))
-    with tempfile.NamedTemporaryFile("w", suffix=".xlsx") as temp_file:
-        namefile.save(temp_file.name)
-        xls = pd.ExcelFile(temp_file.name, engine="openpyxl")
-        for sheetname in xls.sheet_names:
-            if sheetname in ACCEPTED_SHEETNAMES:
-                df = pd.read_excel(xls, sheetname).fillna(0)
-                if sheetname not in [
-                    worksheet.title for worksheet in spreadsheet.worksheets()
-                ]:
-                    worksheet = spreadsheet.add_worksheet(sheetname, rows=100, cols=20)
-                else:
-                    worksheet = spreadsheet.worksheet(sheetname)
-                # clear worksheet and upload new sheet
-                worksheet.clear()
-                header = df.columns.tolist()
-                values = df.values.tolist()
-                # add header
-                logger.info(f"Updating Header: {header}")
-                worksheet.update("A1", [header])
-                # add values
-                logger.info(f"Adding values...")
-                worksheet.update("A2", values)
-                logger.info("Done adding values")
-                # Sort the rows alphabetically based on the specified sort column
-                sort_column_index = header.index("Name") + 1
-                last_column_letter = get_last_column_letter(worksheet)
-                last_row_index = worksheet.row_count
-                worksheet.sort(
-                    (sort_column_index, "asc"),
-                    range=f"A2:{last_column_letter}{last_row_index}",
-                )
+    # read-only mode streams rows from the upload instead of loading the workbook
+    workbook = openpyxl.load_workbook(namefile.stream, read_only=True, data_only=True)
+    try:
+        layouts = read_upload_headers(workbook)
+        spreadsheet = get_spreadsheet(fee_type)
+        for sheetname, (header, row_count) in layouts.items():
+            worksheet = get_worksheet(fee_type, sheetname)
+            if worksheet.row_count < row_count + 1:
+                worksheet.resize(rows=row_count + 1)
+
+        # clear worksheets and upload new sheets
+        spreadsheet.values_batch_clear(
+            body={
+                "ranges": [
+                    gspread.utils.absolute_range_name(sheetname)
+                    for sheetname in layouts
+                ]
+            }
+        )
+        logger.info(f"Adding values...")
+        data = []
+        cells = 0
+        for sheetname, (header, row_count) in layouts.items():
+            logger.info(f"Updating Header: {header}")
+            data.append(
+                {
+                    "range": gspread.utils.absolute_range_name(sheetname, "A1"),
+                    "values": [header],
+                }
+            )
+            cells += len(header)
+            rows = workbook[sheetname].iter_rows(min_row=2, values_only=True)
+            chunk = []
+            start_row = 2
+            for row in rows:
+                if not any(value is not None for value in row):
+                    continue
+                row = list(row[: len(header)]) + [None] * (len(header) - len(row))
+                chunk.append([cell_value(value) for value in row])
+                cells += len(header)
+                if cells >= BATCH_CELL_LIMIT:
+                    data.append(values_range(sheetname, start_row, chunk))
+                    flush_values(spreadsheet, data)
+                    start_row += len(chunk)
+                    data, chunk, cells = [], [], 0
+            if chunk:
+                data.append(values_range(sheetname, start_row, chunk))
+        flush_values(spreadsheet, data)
+        logger.info("Done adding values")
+    finally:
+        workbook.close()
+
+    # uploads arrive in any order; sort them in the background
+    from .sheet_sync import enqueue_sort, sync_worker
+
+    for sheetname, (header, row_count) in layouts.items():
+        cache_header(fee_type, sheetname, header)
+        enqueue_sort(fee_type, sheetname)
+    db.session.commit()
+    sync_worker.wake()
+
+
+def values_range(sheetname: str, start_row: int, values: list):
+    return {
+        "range": gspread.utils.absolute_range_name(sheetname, f"A{start_row}"),
+        "values": values,
+    }
+
+
+def flush_values(spreadsheet, data: list):
+    if data:
+        spreadsheet.values_batch_update(
+            body={"valueInputOption": "RAW", "data": data}
+        )
 
 
 def populate_db(force=False):
-    if not force:
-        check = len(Members.query.all())
-        force = True if not check else False
-        if not force:
-            logger.info(f"db already populated")
-    if force:
-        # purge all records
-        logger.info("Purging all member records")
-        from app import db
-        import csv
-
-        db.session.query(Members).delete()
-        db.session.commit()
-
-        # add new records
-        logger.info("Adding new member records")
-
-        with open("db.tsv", "r") as file:
-            reader = csv.reader(file, delimiter="\t")
-            next(reader)  # skip the header
-            for row in reader:
-                member = Members(
-                    name=row[0].upper(),
-                    phone_no=row[1],
-                    part=row[2].lower(),
-                )
-                member.insert()
-                logger.info(f"Added {row[2]} member with ID: {member.id}")
+    if not force and Members.query.first():
+        logger.info(f"db already populated")
+        return
+    changes = load_roster()
+    if changes["inserted"] or changes["updated"] or changes["deleted"]:
         return populate_sheet()
 
 
+@sheet_priority(BULK)
 def populate_sheet(fee_type="fusion-cantus"):
     logger.info("POPULATING SPREADSHEET WITH DATABASE RECORDS")
-    spreadsheet = gclient.open_by_key(sheets.get(fee_type))
-    parts = ["Soprano", "Alto", "Tenor", "Bass"]
     header = ["Name", "Phone No", "Paid"]
-    for part in parts:
+    totals = Members.totals(fee_type=fee_type)
+    for part in PART_SHEETNAMES:
         members = Members.query.filter(Members.part == part.lower()).all()
-        if part not in [worksheet.title for worksheet in spreadsheet.worksheets()]:
-            worksheet = spreadsheet.add_worksheet(part, rows=100, cols=20)
-        else:
-            worksheet = spreadsheet.worksheet(part)
+        worksheet = get_worksheet(fee_type, part)
         # clear worksheet and upload new record
         worksheet.clear()
-        values = [[member.name, member.phone_no, member.amount()] for member in members]
+        # Sort the rows alphabetically by name before writing them
+        values = sorted(
+            [
+                [member.name, member.phone_no, totals.get(member.id, 0)]
+                for member in members
+            ],
+            key=lambda row: sort_key(row, header.index("Name")),
+        )
         # add header
-        logger.info(f"Updating Header: {header}")
-        worksheet.update("A1", [header])
+        set_header(fee_type, part, header, worksheet)
         # add values
         logger.info("Adding values")
         worksheet.update("A2", values)
         logger.info("Done adding values")
-        # Sort the rows alphabetically based on the specified sort column
-        sort_column_index = header.index("Name") + 1
-        last_column_letter = get_last_column_letter(worksheet)
-        last_row_index = worksheet.row_count
-        worksheet.sort(
-            (sort_column_index, "asc"),
-            range=f"A2:{last_column_letter}{last_row_index}",
+        # the cached rows are exactly what was written
+        sheet_cache.set(("rows", fee_type, part), WorksheetRows([header] + values))
+
+
+@sheet_priority(BULK)
+def reconcile_sheet(fee_type="fusion-cantus", dry_run=False):
+    # compare the "Paid" column of every part worksheet with the db totals and
+    # rewrite only the cells that differ. returns a report per worksheet.
+    logger.info(f"RECONCILING {fee_type} SHEET WITH DATABASE RECORDS")
+    spreadsheet = get_spreadsheet(fee_type)
+    busy = {
+        sheetname
+        for (sheetname,) in db.session.query(SheetUpdates.sheetname)
+        .filter(
+            SheetUpdates.fee_type == fee_type,
+            SheetUpdates.status.in_(["pending", "processing"]),
         )
+        .distinct()
+    }
+    # queued increments would be applied on top of the db total, so leave
+    # worksheets with pending updates until the sync worker has drained them
+    sheetnames = [part for part in PART_SHEETNAMES if part not in busy]
+    report = {part: {"skipped": "pending sheet updates"} for part in busy}
+    if not sheetnames:
+        return report
+    for sheetname in sheetnames:
+        get_worksheet(fee_type, sheetname)  # creates missing worksheets
+
+    response = spreadsheet.values_batch_get(
+        [gspread.utils.absolute_range_name(sheetname) for sheetname in sheetnames],
+        params={"valueRenderOption": "UNFORMATTED_VALUE"},
+    )
+    totals = Members.totals(fee_type=fee_type)
+    members = Members.query.filter(
+        Members.part.in_([sheetname.lower() for sheetname in sheetnames])
+    ).all()
+
+    data = []
+    mirrors = {}
+    for sheetname, value_range in zip(sheetnames, response["valueRanges"]):
+        rows = WorksheetRows(value_range.get("values", []))
+        mirrors[sheetname] = rows
+        result = report[sheetname] = {"mismatched": [], "missing": [], "unknown": []}
+        paid_index = rows.column_index("Paid")
+        if paid_index is None or rows.column_index("Name") is None:
+            result["skipped"] = "missing Name or Paid column"
+            continue
+
+        seen = set()
+        for member in members:
+            if member.part != sheetname.lower():
+                continue
+            row_index = (
+                rows.find("Phone No", member.phone_no)
+                if member.phone_no
+                else rows.find("Name", member.name)
+            )
+            if row_index is None:
+                result["missing"].append(member.name)
+                continue
+            seen.add(row_index)
+            total = totals.get(member.id, 0)
+            sheet_value = rows.get(row_index, "Paid")
+            try:
+                matches = float(sheet_value or 0) == total
+            except ValueError:
+                matches = False
+            if matches:
+                continue
+            result["mismatched"].append(
+                {
+                    "row": row_index,
+                    "name": member.name,
+                    "sheet": sheet_value,
+                    "db": total,
+                }
+            )
+            data.append(
+                {
+                    "range": gspread.utils.absolute_range_name(
+                        sheetname,
+                        gspread.utils.rowcol_to_a1(row_index, paid_index + 1),
+                    ),
+                    "values": [[total]],
+                }
+            )
+            if not dry_run:
+                rows.set(row_index, "Paid", total)
+        result["unknown"] = [
+            rows.get(row_index, "Name")
+            for row_index in range(2, len(rows) + 1)
+            if row_index not in seen and any(rows.rows[row_index - 1])
+        ]
+
+    if dry_run:
+        return report
+    flush_values(spreadsheet, data)
+    logger.info(f"Reconciled {len(data)} cells")
+    # the rows just read, with the fixes applied, are the freshest mirror
+    for sheetname, rows in mirrors.items():
+        sheet_cache.set(("rows", fee_type, sheetname), rows)
+        sheet_cache.set(("header", fee_type, sheetname), list(rows.header))
+    return report
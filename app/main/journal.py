@@ -0,0 +1,134 @@
+# python imports
+import os
+import glob
+import gzip
+import json
+import time
+import queue
+import atexit
+import shutil
+import threading
+import traceback
+from datetime import datetime
+
+# local imports
+from app import logger
+
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+JOURNAL_DIR = os.path.join(LOG_DIR, "webhooks")
+# seconds to gather deliveries before one write and fsync
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", 0.5))
+SEGMENT_PREFIX = "webhooks-"
+
+
+def segment_name(day: str, compressed=False):
+    return f"{SEGMENT_PREFIX}{day}.jsonl" + (".gz" if compressed else "")
+
+
+# append-only journal of webhook deliveries: one json line per delivery in a
+# daily segment, written by a background thread that batches writes and
+# fsyncs once per batch. segments from earlier days are gzipped.
+class WebhookJournal(object):
+    def __init__(self, directory: str = JOURNAL_DIR, interval: float = None) -> None:
+        self.directory = directory
+        self.interval = JOURNAL_FLUSH_INTERVAL if interval is None else interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._day = None
+
+    def write(self, payload: dict):
+        entry = {
+            "received_at": datetime.utcnow().isoformat(),
+            "tx_ref": (payload.get("data") or {}).get("tx_ref"),
+            "payload": payload,
+        }
+        self._queue.put(json.dumps(entry) + "\n")
+        if self._thread is None:
+            self.start()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(
+                    target=self._run, name="webhook-journal", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush(self, lines: list = None):
+        lines = list(lines or [])
+        while True:
+            try:
+                lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not lines:
+            return
+        with self._lock:
+            day = datetime.utcnow().strftime("%Y-%m-%d")
+            if day != self._day:
+                self._day = day
+                self.compress_old_segments()
+            path = os.path.join(self.directory, segment_name(day))
+            # one O_APPEND write per batch keeps lines whole across processes
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, "".join(lines).encode())
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def compress_old_segments(self):
+        today = segment_name(datetime.utcnow().strftime("%Y-%m-%d"))
+        for path in glob.glob(os.path.join(self.directory, segment_name("*"))):
+            if os.path.basename(path) == today:
+                continue
+            # claim the segment first so only one process compresses it
+            claimed = f"{path}.{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            # appending keeps a valid multi-member gzip if the day was
+            # already compressed once
+            with open(claimed, "rb") as source, gzip.open(path + ".gz", "ab") as dest:
+                shutil.copyfileobj(source, dest)
+            os.remove(claimed)
+            logger.info(f"Compressed webhook journal segment {path}")
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            # let a burst of deliveries collect so they share one fsync
+            time.sleep(self.interval)
+            try:
+                self.flush([first])
+            except Exception:
+                logger.error(traceback.format_exc())
+
+
+def iter_journal(directory: str = JOURNAL_DIR, day: str = None):
+    # yield journal entries oldest first, from compressed and open segments
+    pattern = segment_name(day or "*")
+    paths = glob.glob(os.path.join(directory, pattern)) + glob.glob(
+        os.path.join(directory, pattern + ".gz")
+    )
+    for path in sorted(paths):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def search_journal(tx_ref: str, directory: str = JOURNAL_DIR, day: str = None):
+    return [
+        entry
+        for entry in iter_journal(directory, day)
+        if entry.get("tx_ref") == tx_ref
+    ]
+
+
+journal = WebhookJournal()
@@ -0,0 +1,209 @@
+# python imports
+import json
+import traceback
+from datetime import datetime, timedelta
+
+# installed imports
+from sqlalchemy.exc import IntegrityError
+
+# local imports
+from app import db, logger
+from app.models import Transactions, Members, WebhookEvents
+from .worker import PeriodicWorker, claim_pending
+from .sheet_sync import (
+    enqueue_total,
+    enqueue_append,
+    sync_worker,
+)
+from .flutterwave import verify_transaction, is_paid
+from .rollups import record_payment
+from .search import resolve_member
+
+WEBHOOK_BATCH_SIZE = 50
+WEBHOOK_MAX_ATTEMPTS = 5
+WEBHOOK_CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def settle_transaction(
+    tx_ref: str,
+    part: str,
+    fee_type: str,
+    amount: int,
+    member: Members = None,
+    flw_tx_id=None,
+    flw_tx_ref=None,
+    donation=False,
+    name: str = None,
+    commit=True,
+):
+    # record a completed payment and queue its sheet update in one db
+    # transaction. tx_ref is unique, so concurrent settlements of the same
+    # payment (webhook and callback) are serialised by the database.
+    # returns (transaction, settled); settled is False if it was already done.
+    # with commit=False the caller commits, e.g. after settling a batch.
+    tx = Transactions(
+        member_id=member.id if member else None,
+        part=part,
+        fee_type=fee_type,
+        amount=amount,
+        tx_ref=tx_ref,
+        donation=donation,
+    )
+    tx.status = "completed"
+    tx.flw_tx_id = flw_tx_id
+    tx.flw_tx_ref = flw_tx_ref
+    try:
+        with db.session.begin_nested():
+            db.session.add(tx)
+    except IntegrityError:
+        # tx_ref already recorded; lock the row and settle it if still open
+        tx = (
+            Transactions.query.filter(Transactions.tx_ref == tx_ref)
+            .with_for_update()
+            .one()
+        )
+        if tx.status == "completed" or tx.status == "successful":
+            if commit:
+                db.session.commit()
+            logger.info(f"PAYMENT ALREADY VERIFIED: {tx_ref}")
+            return tx, False
+        # a pending checkout; record what flutterwave says was paid
+        tx.status = "completed"
+        tx.part = part
+        tx.fee_type = fee_type
+        tx.amount = amount
+        tx.donation = donation
+        tx.member_id = member.id if member else tx.member_id
+        tx.flw_tx_id = flw_tx_id or tx.flw_tx_id
+        tx.flw_tx_ref = flw_tx_ref or tx.flw_tx_ref
+
+    record_payment(
+        fee_type,
+        part,
+        (tx.created_at or datetime.utcnow()).date(),
+        amount,
+        donation=donation,
+    )
+
+    # queue spreadsheet update
+    if donation:
+        enqueue_append(
+            fee_type=fee_type,
+            sheetname="Donations",
+            data={"Name": name, "Paid": amount},
+        )
+    else:
+        # the worker writes the member's db total, so the sheet can't count
+        # a payment twice however its updates are batched
+        logger.info(f"UPDATING BALANCE FOR {member.name}. ADDING {amount}")
+        enqueue_total(fee_type=fee_type, sheetname=part, member=member)
+    if commit:
+        db.session.commit()
+        sync_worker.wake()
+    return tx, True
+
+
+def settle_webhook(payload: dict):
+    # verify and record the payment in a flutterwave webhook payload.
+    # returns the outcome; raises when the event should be retried.
+    status = payload["data"].get("status")
+    tx_ref = payload["data"].get("tx_ref")
+    flw_tx_id = payload["data"].get("id")
+
+    # get transaction details from database
+    tx = Transactions.query.filter(
+        Transactions.tx_ref == tx_ref,
+    ).one_or_none()
+    if tx and (tx.status == "completed" or tx.status == "successful"):
+        # transaction already settled by the callback
+        logger.info(f"PAYMENT ALREADY VERIFIED: {tx_ref}")
+        return "exists"
+    if status != "completed" and status != "successful":
+        return "rejected"
+
+    # verify transaction
+    data = verify_transaction(flw_tx_id)
+    if data is None:
+        return "rejected"
+    if data["status"] != "success":
+        if tx:
+            tx.status = data["status"]
+            tx.update()
+        return "rejected"
+    if not is_paid(data, tx_ref):
+        # pending, failed, or another checkout's transaction id
+        logger.info(
+            f"NOT SETTLING {tx_ref}: flutterwave has {data['data'].get('status')} "
+            f"for {data['data'].get('tx_ref')}"
+        )
+        return "rejected"
+
+    # record transaction
+    flw_tx_ref = data["data"]["flw_ref"]
+    name = data["data"]["customer"]["name"]
+    amount = data["data"]["amount"]
+    if tx and tx.member_id:
+        # checkout recorded by /tx_ref; it already knows who is paying
+        fee_type = tx.fee_type
+        part = tx.part
+        member = db.session.get(Members, tx.member_id)
+    elif payload.get("source") == "callback":
+        # deferred callback; its checkout carried the member in meta
+        fee_type = data["data"]["meta"]["fee_type"]
+        part = data["data"]["meta"]["part"]
+        member = Members.query.get(int(data["data"]["meta"]["member_id"]))
+    else:
+        # fee_type = data["data"]["meta"]["fee_type"]
+        fee_type = "fusion-cantus"
+        # part = data["data"]["meta"]["part"]
+        part = str(tx_ref).split("-")[0].capitalize()
+        # member_id = int(data["data"]["meta"]["member_id"])
+        # payers type their own name at checkout, so match it loosely
+        member = resolve_member(name, part=part)
+    _, settled = settle_transaction(
+        tx_ref,
+        part=part,
+        fee_type=fee_type,
+        amount=amount,
+        member=member,
+        flw_tx_id=flw_tx_id,
+        flw_tx_ref=flw_tx_ref,
+    )
+    return "settled" if settled else "exists"
+
+
+def defer_verification(tx_ref: str, flw_tx_id, status: str):
+    # queue a callback flutterwave couldn't confirm in time. the webhook
+    # worker verifies and settles it like a webhook delivery.
+    payload = {
+        "source": "callback",
+        "data": {"status": status, "tx_ref": tx_ref, "id": flw_tx_id},
+    }
+    event = WebhookEvents(json.dumps(payload))
+    event.insert()
+    webhook_worker.wake()
+    return event
+
+
+def process_webhooks():
+    events = claim_pending(WebhookEvents, WEBHOOK_BATCH_SIZE, WEBHOOK_CLAIM_TIMEOUT)
+    for event in events:
+        try:
+            event.result = settle_webhook(event.get_payload())
+            event.status = "done"
+            event.error = None
+            logger.info(f"WEBHOOK {event.id} FOR {event.tx_ref}: {event.result}")
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            db.session.rollback()
+            event.attempts += 1
+            event.error = str(e)
+            event.status = (
+                "failed" if event.attempts >= WEBHOOK_MAX_ATTEMPTS else "pending"
+            )
+        event.claim = None
+        db.session.commit()
+    return len(events) == WEBHOOK_BATCH_SIZE
+
+
+webhook_worker = PeriodicWorker("webhooks", process_webhooks)
@@ -0,0 +1,118 @@
+# python imports
+from datetime import date, datetime
+
+# installed imports
+from sqlalchemy.exc import IntegrityError
+
+# local imports
+from app import db, logger
+from app.models import Transactions, PaymentRollups
+
+
+def rollup_part(part: str):
+    return (part or "").lower()
+
+
+def record_payment(fee_type: str, part: str, day: date, amount: int, donation=False):
+    # add one settled payment to its rollup in the caller's db transaction.
+    # the increments happen in sql so concurrent settlements all count.
+    key = (
+        PaymentRollups.fee_type == fee_type,
+        PaymentRollups.part == rollup_part(part),
+        PaymentRollups.day == day,
+    )
+    increments = {
+        "total": PaymentRollups.total + amount,
+        "count": PaymentRollups.count + 1,
+        "donation_total": PaymentRollups.donation_total + (amount if donation else 0),
+    }
+    if PaymentRollups.query.filter(*key).update(increments, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(
+                PaymentRollups(
+                    fee_type,
+                    rollup_part(part),
+                    day,
+                    total=amount,
+                    count=1,
+                    donation_total=amount if donation else 0,
+                )
+            )
+    except IntegrityError:
+        # another settlement created the row first
+        PaymentRollups.query.filter(*key).update(increments, synchronize_session=False)
+
+
+def rebuild_rollups():
+    # recompute every rollup from the completed transactions in one grouped query
+    day = db.func.date(Transactions.created_at)
+    part = db.func.coalesce(db.func.lower(Transactions.part), "")
+    rows = (
+        db.session.query(
+            Transactions.fee_type,
+            part,
+            day,
+            db.func.sum(Transactions.amount),
+            db.func.count(),
+            db.func.sum(
+                db.case((Transactions.donation == True, Transactions.amount), else_=0)
+            ),
+        )
+        .filter(Transactions.status == "completed")
+        .group_by(Transactions.fee_type, part, day)
+        .all()
+    )
+    PaymentRollups.query.delete()
+    db.session.add_all(
+        [
+            PaymentRollups(
+                fee_type,
+                part,
+                # sqlite returns date() as text
+                datetime.strptime(day, "%Y-%m-%d").date()
+                if isinstance(day, str)
+                else day,
+                total=int(total or 0),
+                count=count,
+                donation_total=int(donation_total or 0),
+            )
+            for fee_type, part, day, total, count, donation_total in rows
+        ]
+    )
+    db.session.commit()
+    logger.info(f"Rebuilt {len(rows)} payment rollups")
+    return len(rows)
+
+
+def rollup_totals(fee_type: str = None, start: datetime = None, end: datetime = None):
+    # totals per fee type, with a breakdown by part and by day. reads only
+    # the rollup rows, never the transactions.
+    query = PaymentRollups.query
+    if fee_type:
+        query = query.filter(PaymentRollups.fee_type == fee_type)
+    if start:
+        query = query.filter(PaymentRollups.day >= start.date())
+    if end:
+        query = query.filter(PaymentRollups.day < end.date())
+
+    totals = {}
+    for rollup in query.order_by(PaymentRollups.day):
+        summary = totals.setdefault(
+            rollup.fee_type,
+            {"total": 0, "count": 0, "donation_total": 0, "parts": {}, "days": {}},
+        )
+        for group in (
+            summary,
+            summary["parts"].setdefault(
+                rollup.part, {"total": 0, "count": 0, "donation_total": 0}
+            ),
+            summary["days"].setdefault(
+                rollup.day.isoformat(), {"total": 0, "count": 0, "donation_total": 0}
+            ),
+        ):
+            group["total"] += rollup.total
+            group["count"] += rollup.count
+            group["donation_total"] += rollup.donation_total
+    return totals
@@ -0,0 +1,139 @@
+# python imports
+import os
+import csv
+import json
+import hashlib
+from datetime import datetime
+
+# installed imports
+from sqlalchemy import insert, update, delete
+
+# local imports
+from app import db, logger
+from app.models import Members, Transactions
+from .sheet_cache import TTLCache
+from .search import index_members, unindex_members
+
+ROSTER_FILE = "db.tsv"
+# phone numbers per query when looking up the ids of inserted members
+ROSTER_LOOKUP_CHUNK = 500
+
+# (name, phone no) lists served by /names, keyed by part. cleared on every
+# write; the ttl bounds staleness for writes made by other processes.
+roster_cache = TTLCache(float(os.getenv("ROSTER_CACHE_TTL", 60)))
+last_modified = {}  # part -> (etag, first time that etag was served)
+
+
+def get_part_roster(part: str):
+    roster = roster_cache.get(part)
+    if roster is None:
+        names = [
+            (name, phone_no)
+            for name, phone_no in db.session.query(
+                Members.name, Members.phone_no
+            ).filter(Members.part == part)
+        ]
+        etag = hashlib.sha1(json.dumps(names).encode()).hexdigest()
+        if last_modified.get(part, (None,))[0] != etag:
+            last_modified[part] = (etag, datetime.utcnow().replace(microsecond=0))
+        roster = roster_cache.set(
+            part,
+            {"names": names, "etag": etag, "last_modified": last_modified[part][1]},
+        )
+    return roster
+
+
+def invalidate_roster():
+    roster_cache.clear()
+
+
+def read_roster(path: str = ROSTER_FILE):
+    # stream member rows from the tab separated roster (Name, Phone No, Part)
+    with open(path, "r", newline="") as file:
+        reader = csv.reader(file, delimiter="\t")
+        next(reader, None)  # skip the header
+        for row in reader:
+            if len(row) < 3 or not row[1].strip():
+                continue
+            yield {
+                "name": row[0].strip().upper(),
+                "phone_no": row[1].strip(),
+                "part": row[2].strip().lower(),
+            }
+
+
+def load_roster(path: str = ROSTER_FILE, delete_missing=True):
+    # diff the roster file against the member table by phone number and apply
+    # only the inserts, updates and deletes in one transaction. members missing
+    # from the file who have transactions are kept so none are orphaned.
+    current = {
+        member.phone_no: member
+        for member in db.session.query(
+            Members.id, Members.name, Members.part, Members.phone_no
+        ).filter(Members.phone_no.isnot(None))
+    }
+    inserts = []
+    updates = []
+    seen = set()
+    for row in read_roster(path):
+        if row["phone_no"] in seen:
+            logger.info(f"Skipping duplicate roster phone number: {row['phone_no']}")
+            continue
+        seen.add(row["phone_no"])
+        member = current.get(row["phone_no"])
+        if member is None:
+            inserts.append(row)
+        elif (member.name, member.part) != (row["name"], row["part"]):
+            updates.append({"id": member.id, "name": row["name"], "part": row["part"]})
+
+    missing = [
+        member.id for phone_no, member in current.items() if phone_no not in seen
+    ]
+    kept = set()
+    if missing and delete_missing:
+        kept = {
+            member_id
+            for (member_id,) in db.session.query(Transactions.member_id)
+            .filter(Transactions.member_id.in_(missing))
+            .distinct()
+        }
+    deletes = [member_id for member_id in missing if member_id not in kept]
+
+    try:
+        if inserts:
+            db.session.execute(insert(Members), inserts)
+        if updates:
+            db.session.execute(update(Members), updates)
+        if deletes and delete_missing:
+            unindex_members(deletes)
+            db.session.execute(
+                delete(Members).where(Members.id.in_(deletes)),
+                execution_options={"synchronize_session": False},
+            )
+        # index only the members this load added or renamed
+        changed_ids = [row["id"] for row in updates]
+        for start in range(0, len(inserts), ROSTER_LOOKUP_CHUNK):
+            phone_nos = [
+                row["phone_no"] for row in inserts[start : start + ROSTER_LOOKUP_CHUNK]
+            ]
+            changed_ids.extend(
+                member_id
+                for (member_id,) in db.session.query(Members.id).filter(
+                    Members.phone_no.in_(phone_nos)
+                )
+            )
+        index_members(changed_ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    invalidate_roster()
+
+    changes = {
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "deleted": len(deletes) if delete_missing else 0,
+        "kept": len(kept) if delete_missing else len(missing),
+    }
+    logger.info(f"Loaded member roster from {path}: {changes}")
+    return changes
@@ -1,23 +1,48 @@
 # python imports
 import os
+import re
 import json
-import time
 import traceback
-from datetime import datetime
 
 # installed imports
 import requests
 from dotenv import load_dotenv
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for
+from flask import (
+    Blueprint,
+    Response,
+    render_template,
+    request,
+    jsonify,
+    redirect,
+    url_for,
+    stream_with_context,
+)
 
 # local imports
-from app import logger, csrf
-from app.models import Transactions, Members
+from app import db, logger, csrf
+from app.models import Transactions, Members, WebhookEvents
 from .functions import (
-    find_and_replace,
     add_record,
     file_upload,
 )
+from .payments import settle_transaction, defer_verification, webhook_worker
+from .flutterwave import verify_transaction, is_paid
+from .roster import get_part_roster, invalidate_roster
+from .journal import journal
+from .exports import (
+    export_filters,
+    transaction_rows,
+    balance_rows,
+    csv_stream,
+    xlsx_stream,
+)
+from .rollups import rollup_totals
+from .search import (
+    index_members,
+    search_members,
+    SEARCH_PAGE_SIZE,
+    SEARCH_MAX_PAGE_SIZE,
+)
 
 main = Blueprint("main", __name__)
 
@@ -25,9 +50,6 @@ load_dotenv()
 
 RAVE_PUB_KEY = os.getenv("RAVE_PUBLIC_KEY")
 RAVE_SEC_KEY = os.getenv("RAVE_SECRET_KEY")
-LOG_DIR = os.getenv("LOG_DIR", "logs")
-WEBHOOK_LOG = os.path.join(LOG_DIR, "webhooks")
-os.makedirs(WEBHOOK_LOG, exist_ok=True)
 
 # MAIN ROUTES ------------------------
 @main.get("/")
@@ -42,17 +64,36 @@ def get_names():
         fee_type = request.args.get("fee_type")
         logger.info(f"Getting names for {fee_type} {part}")
 
-        names = [
-            (member.name, member.phone_no)
-            for member in Members.query.filter(Members.part == part).all()
-        ]
-
-        return jsonify(names=names)
+        roster = get_part_roster(part)
+        response = jsonify(names=roster["names"])
+        response.set_etag(roster["etag"])
+        response.last_modified = roster["last_modified"]
+        response.cache_control.no_cache = True
+        # answers If-None-Match / If-Modified-Since with a 304
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(traceback.format_exc())
         return jsonify(message="Failed to get names", error=str(e)), 500
 
 
+@main.get("/members/search")
+def member_search():
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+        per_page = int(request.args.get("per_page", SEARCH_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify(message="page and per_page must be numbers", error=str(e)), 400
+    per_page = min(max(per_page, 1), SEARCH_MAX_PAGE_SIZE)
+    results = search_members(
+        request.args.get("q", ""),
+        part=request.args.get("part"),
+        page=page,
+        per_page=per_page,
+    )
+    results["has_next"] = page * per_page < results["total"]
+    return jsonify(results)
+
+
 @main.post("/tx_ref")
 def get_tx_ref():
     try:
@@ -60,9 +101,21 @@ def get_tx_ref():
         data = request.get_json()
         part = data.get("part")
         name = data.get("name")
+        fee_type = data.get("fee_type")
+        amount = data.get("amount")
 
         tx_ref = Transactions.get_tx_ref(part)
         member = Members.query.filter(Members.name == name).one_or_404()
+        if fee_type and amount:
+            # record the checkout so the verifier can settle it if both the
+            # callback and the webhook are missed
+            Transactions(
+                part=part,
+                fee_type=fee_type,
+                amount=int(float(amount)),
+                tx_ref=tx_ref,
+                member_id=member.id,
+            ).insert()
 
         logger.info(f"TX_REF: {tx_ref}")
         return jsonify(tx_ref=tx_ref, member_id=member.id)
@@ -92,6 +145,49 @@ def admin():
     return render_template("admin.html", title="Admin Portal")
 
 
+@main.get("/admin/totals")
+def admin_totals():
+    try:
+        filters = export_filters(request.args)
+    except ValueError as e:
+        return jsonify(message="Dates must be YYYY-MM-DD", error=str(e)), 400
+    totals = rollup_totals(filters["fee_type"], filters["start"], filters["end"])
+    return jsonify(totals=totals)
+
+
+@main.get("/admin/export/<any(transactions, balances):report>.<any(csv, xlsx):fmt>")
+def export(report, fmt):
+    try:
+        filters = export_filters(request.args)
+    except ValueError as e:
+        return jsonify(message="Dates must be YYYY-MM-DD", error=str(e)), 400
+    if report == "transactions":
+        rows = transaction_rows(filters)
+    else:
+        rows = balance_rows(filters)
+    if fmt == "csv":
+        body = csv_stream(rows)
+        mimetype = "text/csv"
+    else:
+        body = xlsx_stream(rows, title=report.capitalize())
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    filename = "-".join(
+        [report]
+        + [
+            re.sub(r"[^\w.-]", "", request.args[key])
+            for key in ("fee_type", "part", "start", "end")
+            if request.args.get(key)
+        ]
+    )
+    logger.info(f"EXPORTING {filename}.{fmt}")
+    # rows are read from the db as the response is sent
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
+
+
 @main.post("/add-name")
 def add_name():
     try:
@@ -106,6 +202,9 @@ def add_name():
         phone_no = form.get("phone_no")
         new_member = Members(name.upper(), part.lower(), phone_no)
         new_member.insert()
+        index_members([new_member.id])
+        db.session.commit()
+        invalidate_roster()
         data = {
             "Name": name.upper(),
             "Phone No": phone_no,
@@ -133,43 +232,17 @@ def add_payment():
         tx_ref = Transactions.get_tx_ref(part)
         member = Members.query.filter(Members.phone_no == phone_no).one_or_404() if not donation else None
 
-        # create transaction record
-        transaction = (
-            Transactions(
-                member_id=member.id,
-                part=part,
-                fee_type=fee_type,
-                amount=amount,
-                tx_ref=tx_ref,
-            )
-            if not donation
-            else Transactions(
-                part=part,
-                fee_type=fee_type,
-                amount=amount,
-                tx_ref=tx_ref,
-                donation=donation,
-            )
+        # create transaction record and queue speadsheet update
+        transaction, _ = settle_transaction(
+            tx_ref,
+            part=part,
+            fee_type=fee_type,
+            amount=amount,
+            member=member,
+            donation=donation,
+            name=name,
         )
-        transaction.status = "completed"
-        transaction.insert()
         logger.info(f"TX_REF: {transaction.tx_ref}")
-        # update speadsheet
-        if not donation:
-            find_and_replace(
-                fee_type=fee_type,
-                sheetname=part,
-                identify_col="Phone No",
-                identify_value=phone_no,
-                column_name="Paid",
-                new_value=amount,
-                replace=False,
-            )
-        else:
-            donor_data = {"Name": name, "Paid": amount}
-            add_record(
-                donor_data, sheetname="Donations", fee_type=fee_type, donation=True
-            )
         return jsonify(success=True)
     except Exception as e:
         logger.error(traceback.format_exc())
@@ -180,100 +253,17 @@ def add_payment():
 @main.post("/payment-webhook")
 @csrf.exempt
 def payment_webhook():
-    time.sleep(10)  # delay to avoid concurrent request with callback
     if request.headers.get("verif-hash") == RAVE_SEC_KEY:
         try:
             payload = request.get_json()
-
-            # create directory for each day
-            directory = os.path.join(
-                WEBHOOK_LOG, datetime.utcnow().strftime("%d-%m-%Y")
-            )
-            os.makedirs(directory, exist_ok=True)
-            log_file = os.path.join(
-                directory, f"{datetime.utcnow().strftime('%H:%M:%S')}.json"
-            )
-            with open(log_file, "w") as file:
-                json.dump(payload, file)
-
-            # get transaction details from payload
-            status = payload["data"].get("status")
-            tx_ref = payload["data"].get("tx_ref")
-            flw_tx_id = payload["data"].get("id")
-
-            # get transaction details from database
-            tx = Transactions.query.filter(
-                Transactions.tx_ref == tx_ref,
-            ).one_or_none()
-            if not tx:  # new transaciton
-                # get transaction status
-                if status == "completed" or status == "successful":
-                    verify_url = f"https://api.flutterwave.com/v3/transactions/{int(flw_tx_id)}/verify"
-                    try:
-                        # verify transaction
-                        response = requests.get(
-                            verify_url,
-                            headers={
-                                "Content-Type": "application/json",
-                                "Authorization": f"Bearer {RAVE_SEC_KEY}",
-                            },
-                        )
-                        if response.status_code == 200:
-                            data = response.json()
-                            if data["status"] == "success":
-                                # create transaction
-                                flw_tx_ref = data["data"]["flw_ref"]
-                                name = data["data"]["customer"]["name"]
-                                amount = data["data"]["amount"]
-                                # fee_type = data["data"]["meta"]["fee_type"]
-                                fee_type = "fusion-cantus"
-                                # part = data["data"]["meta"]["part"]
-                                part = str(tx_ref).split("-")[0].capitalize()
-                                # member_id = int(data["data"]["meta"]["member_id"])
-                                member = Members.query.filter(Members.name == name).one()
-                                tx = Transactions(
-                                    member_id=member.id,
-                                    part=part,
-                                    fee_type=fee_type,
-                                    amount=amount,
-                                    tx_ref=tx_ref,
-                                )
-                                tx.insert()
-                                # update record as successful
-                                tx.status = "completed"
-                                tx.flw_tx_id = flw_tx_id
-                                tx.flw_tx_ref = flw_tx_ref
-                                tx.update()
-                                # update spreadsheet
-                                logger.info(
-                                    f"UPDATING BALANCE FOR {name}. ADDING {amount}"
-                                )
-                                find_and_replace(
-                                    fee_type=fee_type,
-                                    sheetname=part,
-                                    identify_col="Phone No",
-                                    identify_value=member.phone_no,
-                                    column_name="Paid",
-                                    new_value=member.amount(),
-                                )
-                                return jsonify({"success": True}), 200
-                            else:
-                                tx.status = data["status"]
-                                tx.update()
-                                return jsonify({"success": False}), 417
-                        else:
-                            return jsonify({"success": False}), 417
-                    except:
-                        logger.error(traceback.format_exc())
-                        return jsonify({"success": False}), 500
-                else:
-                    return jsonify({"success": False}), 417
-            else:
-                # transaction already exists
-                if tx.status == "completed" or tx.status == "successful":
-                    logger.info(f"PAYMENT ALREADY VERIFIED: {tx_ref}")
-                    return jsonify({"success": True}), 200
-                return jsonify({"success": False}), 500
+            # keep a copy of every delivery in the journal
+            journal.write(payload)
+
+            # store the event and settle it in the background
+            event = WebhookEvents(json.dumps(payload))
+            event.insert()
+            webhook_worker.wake()
+            return jsonify({"success": True}), 200
         except:
             logger.error(traceback.format_exc())
             return jsonify({"success": False}), 500
@@ -296,107 +286,67 @@ def payment_callback():
         tx = Transactions.query.filter(
             Transactions.tx_ref == tx_ref,
         ).one_or_none()
-        if not tx:  # new transaction
+        if not tx or not (tx.status == "completed" or tx.status == "successful"):
             # get transaction status
             if status == "completed" or status == "successful":
-                verify_url = f"https://api.flutterwave.com/v3/transactions/{int(flw_tx_id)}/verify"
+                # verify transaction
                 try:
-                    # verify transaction
-                    response = requests.get(
-                        verify_url,
-                        headers={
-                            "Content-Type": "application/json",
-                            "Authorization": f"Bearer {RAVE_SEC_KEY}",
-                        },
+                    data = verify_transaction(flw_tx_id, fast=True)
+                except requests.RequestException:
+                    # flutterwave is slow; verify and settle in the background
+                    logger.info(f"DEFERRING VERIFICATION FOR {tx_ref}")
+                    defer_verification(tx_ref, flw_tx_id, status)
+                    message = "<h3>Thank you ❤️✨</h3><p class='h6 mb-2'>We are confirming your payment and will record it shortly. Please don't pay again.</p>"
+                    link_mssg = "Back to payments"
+                    return redirect(
+                        url_for("main.thanks", message=message, link_mssg=link_mssg)
+                        + "#main-body"
                     )
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data["status"] == "success":
-                            # create transaction
-                            flw_tx_ref = data["data"]["flw_ref"]
-                            name = data["data"]["customer"]["name"]
-                            amount = data["data"]["amount"]
-                            fee_type = data["data"]["meta"]["fee_type"]
-                            part = data["data"]["meta"]["part"]
-                            member_id = int(data["data"]["meta"]["member_id"])
-                            member = Members.query.get(member_id)
-                            tx = Transactions(
-                                member_id=member.id,
-                                part=part,
-                                fee_type=fee_type,
-                                amount=amount,
-                                tx_ref=tx_ref,
-                            )
-                            tx.insert()
-                            # update record as successful
-                            tx.status = "completed"
-                            tx.flw_tx_id = flw_tx_id
-                            tx.flw_tx_ref = flw_tx_ref
-                            tx.update()
-                            # update spreadsheet
-                            logger.info(f"UPDATING BALANCE FOR {name}. ADDING {amount}")
-                            total = find_and_replace(
-                                fee_type=fee_type,
-                                sheetname=part,
-                                identify_col="Phone No",
-                                identify_value=member.phone_no,
-                                column_name="Paid",
-                                new_value=member.amount(),
-                            )
+                if data:
+                    if is_paid(data, tx_ref):
+                        # record transaction
+                        flw_tx_ref = data["data"]["flw_ref"]
+                        amount = data["data"]["amount"]
+                        fee_type = data["data"]["meta"]["fee_type"]
+                        part = data["data"]["meta"]["part"]
+                        member_id = int(data["data"]["meta"]["member_id"])
+                        member = Members.query.get(member_id)
+                        # the sheet is updated by the sync worker
+                        settle_transaction(
+                            tx_ref,
+                            part=part,
+                            fee_type=fee_type,
+                            amount=amount,
+                            member=member,
+                            flw_tx_id=flw_tx_id,
+                            flw_tx_ref=flw_tx_ref,
+                        )
 
-                            message = f"<h3>Thank you for completing the payment ❤️✨</h3><p class='h6 mb-2'>You have paid ₦{member.amount():.2f} in total.</p>"
-                            link_mssg = "Pay again?"
-                            return redirect(
-                                url_for(
-                                    "main.thanks",
-                                    message=message,
-                                    link_mssg=link_mssg,
-                                    fee_type=fee_type,
-                                )
-                                + "#main-body"
-                            )
-                        else:
-                            tx.status = data["status"]
-                            tx.update()
-                            return redirect(
-                                url_for(
-                                    "main.thanks",
-                                    message=message,
-                                    link_mssg=link_mssg,
-                                )
-                                + "#main-body"
-                            )
-                    else:
+                        total = member.amount()
+                        message = f"<h3>Thank you for completing the payment ❤️✨</h3><p class='h6 mb-2'>You have paid ₦{total:.2f} in total.</p>"
+                        link_mssg = "Pay again?"
                         return redirect(
-                            url_for("main.thanks", message=message, link_mssg=link_mssg)
+                            url_for(
+                                "main.thanks",
+                                message=message,
+                                link_mssg=link_mssg,
+                                fee_type=fee_type,
+                            )
                             + "#main-body"
                         )
-                except:
-                    logger.error(traceback.format_exc())
-                    return redirect(
-                        url_for("main.thanks", message=message, link_mssg=link_mssg)
-                        + "#main-body"
-                    )
-            else:
-                return redirect(
-                    url_for("main.thanks", message=message, link_mssg=link_mssg)
-                    + "#main-body"
-                )
+                    elif tx and data["status"] != "success":
+                        tx.status = data["status"]
+                        tx.update()
         else:
             # transaction already exists
-            if tx.status == "completed" or tx.status == "successful":
-                logger.info(f"PAYMENT ALREADY VERIFIED: {tx_ref}")
-                total = Members.query.get(
-                    Transactions.query.filter(Transactions.tx_ref == tx_ref)
-                    .one()
-                    .member_id
-                ).amount()
-                message = f"<h3>Thank you for completing the payment ❤️✨</h3><p class='h6 mb-2'>You have paid ₦{total:.2f} in total.</p>"
-                link_mssg = "Pay again?"
-            return redirect(
-                url_for("main.thanks", message=message, link_mssg=link_mssg)
-                + "#main-body"
-            )
+            logger.info(f"PAYMENT ALREADY VERIFIED: {tx_ref}")
+            total = Members.totals([tx.member_id]).get(tx.member_id, 0)
+            message = f"<h3>Thank you for completing the payment ❤️✨</h3><p class='h6 mb-2'>You have paid ₦{total:.2f} in total.</p>"
+            link_mssg = "Pay again?"
+        return redirect(
+            url_for("main.thanks", message=message, link_mssg=link_mssg)
+            + "#main-body"
+        )
     except:
         logger.error(traceback.format_exc())
         return redirect(
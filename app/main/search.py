@@ -0,0 +1,177 @@
+# python imports
+import os
+import re
+import math
+import unicodedata
+
+# installed imports
+from sqlalchemy import insert, delete
+from sqlalchemy.exc import NoResultFound, MultipleResultsFound
+
+# local imports
+from app import db, logger
+from app.models import Members, MemberTerms
+
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", 20))
+SEARCH_MAX_PAGE_SIZE = 50
+# share of a query's trigrams a name needs when none of its tokens match
+SEARCH_MIN_SIMILARITY = float(os.getenv("SEARCH_MIN_SIMILARITY", 0.4))
+# candidates considered when resolving a payer's name
+RESOLVE_CANDIDATES = 5
+# lead over the runner up a payer's name needs when some of its words don't
+# match a member's name exactly
+RESOLVE_MARGIN = 20
+INDEX_BATCH_SIZE = 1000
+
+# score of each matching term; every shared trigram adds 1
+NAME_WEIGHT = 100  # the whole name
+TOKEN_WEIGHT = 10  # a name token equal to a query token
+PREFIX_WEIGHT = 5  # a name token starting with a query token
+
+
+def normalize_name(name: str):
+    # casefold, drop accents and punctuation, collapse whitespace
+    decomposed = unicodedata.normalize("NFKD", (name or "").casefold())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.findall(r"[^\W_]+", stripped))
+
+
+def trigrams(token: str):
+    # padded like pg_trgm so short tokens and word starts get trigrams too
+    padded = f"  {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def name_terms(name: str):
+    normalized = normalize_name(name)
+    tokens = set(normalized.split())
+    terms = {("name", normalized)} if normalized else set()
+    terms.update(("token", token) for token in tokens)
+    terms.update(("trigram", gram) for token in tokens for gram in trigrams(token))
+    return terms
+
+
+def unindex_members(member_ids: list = None):
+    query = delete(MemberTerms)
+    if member_ids is not None:
+        query = query.where(MemberTerms.member_id.in_(member_ids))
+    db.session.execute(query, execution_options={"synchronize_session": False})
+
+
+def index_members(member_ids: list = None):
+    # rebuild the search terms of the given members, or of everyone, in the
+    # caller's db transaction
+    if member_ids is not None and not member_ids:
+        return 0
+    unindex_members(member_ids)
+    query = db.session.query(Members.id, Members.name)
+    if member_ids is not None:
+        query = query.filter(Members.id.in_(member_ids))
+    members = query.all()
+    rows = [
+        {"member_id": member_id, "kind": kind, "term": term}
+        for member_id, name in members
+        for kind, term in name_terms(name)
+    ]
+    for start in range(0, len(rows), INDEX_BATCH_SIZE):
+        db.session.execute(insert(MemberTerms), rows[start : start + INDEX_BATCH_SIZE])
+    return len(members)
+
+
+def search_members(
+    query: str, part: str = None, page: int = 1, per_page: int = SEARCH_PAGE_SIZE
+):
+    # members ranked by how well their name matches `query`: the whole name,
+    # whole tokens, token prefixes, then shared trigrams
+    normalized = normalize_name(query)
+    results = {"results": [], "page": page, "per_page": per_page, "total": 0}
+    if not normalized:
+        return results
+    tokens = normalized.split()
+    grams = set().union(*(trigrams(token) for token in tokens))
+
+    is_token = MemberTerms.kind == "token"
+    exact_token = db.and_(is_token, MemberTerms.term.in_(tokens))
+    score = db.func.sum(
+        db.case(
+            (MemberTerms.kind == "name", NAME_WEIGHT),
+            (exact_token, TOKEN_WEIGHT),
+            (is_token, PREFIX_WEIGHT),
+            else_=1,
+        )
+    )
+    matched_tokens = db.func.sum(db.case((exact_token, 1), else_=0))
+    shared_trigrams = db.func.sum(db.case((MemberTerms.kind == "trigram", 1), else_=0))
+    scores = (
+        db.select(
+            MemberTerms.member_id,
+            score.label("score"),
+            matched_tokens.label("matched_tokens"),
+        )
+        .where(
+            db.or_(
+                db.and_(MemberTerms.kind == "name", MemberTerms.term == normalized),
+                db.and_(
+                    is_token, db.or_(*[MemberTerms.term.like(f"{t}%") for t in tokens])
+                ),
+                db.and_(MemberTerms.kind == "trigram", MemberTerms.term.in_(grams)),
+            )
+        )
+        .group_by(MemberTerms.member_id)
+        .having(
+            db.or_(
+                score > shared_trigrams,
+                shared_trigrams >= math.ceil(SEARCH_MIN_SIMILARITY * len(grams)),
+            )
+        )
+        .subquery()
+    )
+    matches = db.select(
+        Members.id, Members.name, Members.part, scores.c.score, scores.c.matched_tokens
+    ).join(scores, scores.c.member_id == Members.id)
+    if part:
+        matches = matches.where(Members.part == part.lower())
+
+    results["total"] = db.session.execute(
+        db.select(db.func.count()).select_from(matches.subquery())
+    ).scalar()
+    rows = db.session.execute(
+        matches.order_by(scores.c.score.desc(), Members.name, Members.id)
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    )
+    results["results"] = [
+        {
+            "id": member_id,
+            "name": name,
+            "part": member_part,
+            "score": int(member_score),
+            "matched_tokens": int(member_tokens),
+        }
+        for member_id, name, member_part, member_score, member_tokens in rows
+    ]
+    return results
+
+
+def resolve_member(name: str, part: str = None):
+    # the member a payer's name refers to. the best candidate must match every
+    # word of the name and outscore the runner up, or lead it by
+    # RESOLVE_MARGIN; otherwise this raises NoResultFound or
+    # MultipleResultsFound like Query.one().
+    results = search_members(name, part=part, per_page=RESOLVE_CANDIDATES)["results"]
+    if part and not (results and results[0]["matched_tokens"]):
+        # the part came from the tx_ref; look beyond it before giving up
+        results = search_members(name, per_page=RESOLVE_CANDIDATES)["results"]
+    ranked = ", ".join(f"{r['name']} ({r['part']}, {r['score']})" for r in results)
+    logger.info(f"MEMBER CANDIDATES FOR {name!r}: {ranked or 'none'}")
+
+    if not results or not results[0]["matched_tokens"]:
+        raise NoResultFound(f"No member matches {name!r}: {ranked or 'no candidates'}")
+    best = results[0]
+    runner_up = results[1]["score"] if len(results) > 1 else 0
+    if best["score"] == runner_up:
+        raise MultipleResultsFound(f"Several members match {name!r}: {ranked}")
+    every_token = best["matched_tokens"] == len(set(normalize_name(name).split()))
+    if not every_token and best["score"] - runner_up < RESOLVE_MARGIN:
+        raise NoResultFound(f"No member clearly matches {name!r}: {ranked}")
+    return db.session.get(Members, best["id"])
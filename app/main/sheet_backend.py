@@ -0,0 +1,348 @@
+# python imports
+import os
+import json
+import time
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from urllib.parse import urlparse
+
+# installed imports
+import gspread
+from gspread.utils import a1_to_rowcol, a1_range_to_grid_range
+from oauth2client.service_account import ServiceAccountCredentials
+
+# local imports
+from app.metrics import record_sheet_call, record_sheet_retry
+from .sheet_cache import sheet_cache
+from .sheet_quota import (
+    RETRY_STATUSES,
+    SHEETS_MAX_RETRIES,
+    backoff_delay,
+    is_idempotent,
+    scheduler,
+)
+
+# "gspread" talks to google, "local" keeps spreadsheets in memory
+SHEET_BACKEND = os.getenv("SHEET_BACKEND", "gspread")
+
+# Set up the scope for accessing Google Sheets
+scope = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive",
+]
+
+
+# where spreadsheets are opened from. every api request made through a
+# backend is counted in `calls` so quota use can be measured, and waits for
+# a token from `scheduler` when one is set.
+class SheetBackend(ABC):
+    def __init__(self, scheduler=None) -> None:
+        self.scheduler = scheduler
+        self.calls = Counter()
+        self._calls_lock = threading.Lock()
+
+    @abstractmethod
+    def open(self, key: str):
+        # spreadsheet with the gspread Spreadsheet methods the app uses
+        ...
+
+    def count(self, name: str, seconds: float = 0, failed=False):
+        with self._calls_lock:
+            self.calls[name] += 1
+        record_sheet_call(name, seconds, failed)
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def reset_calls(self):
+        with self._calls_lock:
+            self.calls.clear()
+
+
+def api_method(method: str, endpoint: str):
+    # the sheets api method a request calls, e.g. "values.batchGet". calls
+    # are counted under these names whichever backend makes them.
+    path = urlparse(endpoint).path
+    if "/drive/" in path:
+        resource = "files"
+    elif "/values" in path:
+        resource = "values"
+    else:
+        resource = "spreadsheets"
+    last = path.rsplit("/", 1)[-1]
+    if ":" in last:
+        return f"{resource}.{last.rsplit(':', 1)[-1]}"
+    verb = {"GET": "get", "PUT": "update", "POST": "create", "DELETE": "delete"}
+    return f"{resource}.{verb.get(method.upper(), method.lower())}"
+
+
+# gspread client whose requests go through the backend's quota scheduler.
+# 429s, and 5xx responses to requests that are safe to repeat, are retried
+# with jittered exponential backoff.
+class QuotaClient(gspread.Client):
+    backend = None
+
+    def request(self, method, endpoint, *args, **kwargs):
+        call = api_method(method, endpoint)
+        attempt = 0
+        while True:
+            if self.backend.scheduler:
+                self.backend.scheduler.acquire()
+            start = time.perf_counter()
+            try:
+                response = super().request(method, endpoint, *args, **kwargs)
+            except gspread.exceptions.APIError as e:
+                self.backend.count(call, time.perf_counter() - start, failed=True)
+                status = e.response.status_code
+                retry = status in RETRY_STATUSES and (
+                    status == 429 or is_idempotent(method, endpoint)
+                )
+                if not retry or attempt >= SHEETS_MAX_RETRIES:
+                    raise
+                record_sheet_retry(status)
+                retry_after = e.response.headers.get("Retry-After")
+                time.sleep(backoff_delay(attempt, retry_after))
+                attempt += 1
+                continue
+            except Exception:
+                self.backend.count(call, time.perf_counter() - start, failed=True)
+                raise
+            self.backend.count(call, time.perf_counter() - start)
+            return response
+
+
+class GspreadBackend(SheetBackend):
+    def __init__(self, credentials: dict = None, scheduler=scheduler) -> None:
+        super().__init__(scheduler)
+        self.credentials = credentials
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        # created on first use so the app starts without touching google
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    # Authenticate with Google Sheets
+                    credentials = self.credentials or json.loads(
+                        os.getenv("CREDENTIALS_FILE"), strict=False
+                    )
+                    creds = ServiceAccountCredentials.from_json_keyfile_dict(
+                        credentials, scope
+                    )
+                    client = gspread.authorize(creds, client_factory=QuotaClient)
+                    client.backend = self
+                    self._client = client
+        return self._client
+
+    def open(self, key: str):
+        return self.client.open_by_key(key)
+
+
+# in memory stand-in for google sheets. each method that would be an api
+# request is counted under the api method gspread would call and waits
+# `latency` seconds, like a round trip would.
+class LocalBackend(SheetBackend):
+    def __init__(self, latency: float = 0, scheduler=None) -> None:
+        super().__init__(scheduler)
+        self.latency = latency
+        self.spreadsheets = {}
+        self._lock = threading.RLock()
+
+    def request(self, name: str):
+        if self.scheduler:
+            self.scheduler.acquire()
+        if self.latency:
+            time.sleep(self.latency)
+        self.count(name, self.latency)
+
+    def open(self, key: str):
+        self.request("spreadsheets.get")
+        with self._lock:
+            if key not in self.spreadsheets:
+                self.spreadsheets[key] = LocalSpreadsheet(self, key)
+            return self.spreadsheets[key]
+
+
+class LocalSpreadsheet(object):
+    def __init__(self, backend: LocalBackend, key: str) -> None:
+        self.backend = backend
+        self.id = key
+        self.title = key
+        self._worksheets = {}
+
+    def worksheets(self):
+        self.backend.request("spreadsheets.get")
+        return list(self._worksheets.values())
+
+    def worksheet(self, title: str):
+        self.backend.request("spreadsheets.get")
+        if title not in self._worksheets:
+            raise gspread.WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def add_worksheet(self, title: str, rows: int, cols: int):
+        self.backend.request("spreadsheets.batchUpdate")
+        with self.backend._lock:
+            worksheet = LocalWorksheet(self, title, rows, cols)
+            self._worksheets[title] = worksheet
+        return worksheet
+
+    def values_batch_get(self, ranges: list, params: dict = None):
+        self.backend.request("values.batchGet")
+        value_ranges = []
+        for range_name in ranges:
+            worksheet, cells = self._resolve(range_name)
+            value_ranges.append(
+                {"range": range_name, "values": worksheet.read(cells)}
+            )
+        return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+
+    def values_batch_update(self, body: dict, params: dict = None):
+        self.backend.request("values.batchUpdate")
+        for data in body["data"]:
+            worksheet, cells = self._resolve(data["range"])
+            worksheet.write(cells or "A1", data["values"])
+
+    def values_batch_clear(self, body: dict, params: dict = None):
+        self.backend.request("values.batchClear")
+        for range_name in body["ranges"]:
+            worksheet, cells = self._resolve(range_name)
+            worksheet.values = []
+
+    def _resolve(self, range_name: str):
+        title, _, cells = range_name.partition("!")
+        title = title.strip("'").replace("''", "'")
+        if title not in self._worksheets:
+            raise gspread.WorksheetNotFound(title)
+        return self._worksheets[title], cells
+
+
+class LocalWorksheet(object):
+    def __init__(self, spreadsheet: LocalSpreadsheet, title: str, rows: int, cols: int):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.row_count = rows
+        self.col_count = cols
+        self.values = []
+
+    @property
+    def backend(self):
+        return self.spreadsheet.backend
+
+    # api methods
+    def get_all_values(self):
+        self.backend.request("values.get")
+        return self.read()
+
+    def row_values(self, row: int):
+        self.backend.request("values.get")
+        return list(self.values[row - 1]) if row <= len(self.values) else []
+
+    def update(self, range_name: str, values: list = None, **kwargs):
+        self.backend.request("values.update")
+        self.write(range_name, values)
+
+    def update_cell(self, row: int, col: int, value):
+        self.backend.request("values.update")
+        self.write(gspread.utils.rowcol_to_a1(row, col), [[value]])
+
+    def batch_update(self, data: list, **kwargs):
+        self.backend.request("values.batchUpdate")
+        for update in data:
+            self.write(update["range"], update["values"])
+
+    def insert_row(self, values: list, index: int = 1, **kwargs):
+        # gspread sends two requests: an insertDimension batchUpdate for the
+        # empty row, then a values:append that fills it
+        self.backend.request("spreadsheets.batchUpdate")
+        self.backend.request("values.append")
+        with self.backend._lock:
+            while len(self.values) < index - 1:
+                self.values.append([])
+            self.values.insert(index - 1, [str(value) for value in values])
+            self.row_count += 1
+
+    def sort(self, *specs, range: str = None):
+        self.backend.request("spreadsheets.batchUpdate")
+        with self.backend._lock:
+            grid = a1_range_to_grid_range(range) if range else {}
+            start = grid.get("startRowIndex", 0)
+            end = grid.get("endRowIndex", len(self.values))
+            rows = self.values[start:end]
+            # sort by the last spec first so earlier specs take priority
+            for column, order in reversed(specs):
+                rows.sort(
+                    key=lambda row: str(row[column - 1]).casefold()
+                    if column <= len(row)
+                    else "",
+                    reverse=order == "des",
+                )
+            self.values[start:end] = rows
+
+    def clear(self):
+        self.backend.request("values.clear")
+        self.values = []
+
+    def resize(self, rows: int = None, cols: int = None):
+        self.backend.request("spreadsheets.batchUpdate")
+        if rows is not None:
+            self.row_count = rows
+            del self.values[rows:]
+        if cols is not None:
+            self.col_count = cols
+
+    # local helpers, not counted
+    def read(self, cells: str = None):
+        values = [list(row) for row in self.values]
+        if not cells:
+            return values
+        grid = a1_range_to_grid_range(cells)
+        start_row = grid.get("startRowIndex", 0)
+        end_row = grid.get("endRowIndex", len(values))
+        start_col = grid.get("startColumnIndex", 0)
+        end_col = grid.get("endColumnIndex")
+        return [row[start_col:end_col] for row in values[start_row:end_row]]
+
+    def write(self, cells: str, values: list):
+        start_row, start_col = a1_to_rowcol(cells.split(":")[0])
+        with self.backend._lock:
+            for row_offset, row in enumerate(values or []):
+                row_index = start_row - 1 + row_offset
+                while len(self.values) <= row_index:
+                    self.values.append([])
+                target = self.values[row_index]
+                for col_offset, value in enumerate(row):
+                    col_index = start_col - 1 + col_offset
+                    target.extend([""] * (col_index + 1 - len(target)))
+                    target[col_index] = "" if value is None else str(value)
+            self.row_count = max(self.row_count, len(self.values))
+
+
+backend = None
+backend_lock = threading.Lock()
+
+
+def get_backend() -> SheetBackend:
+    global backend
+    if backend is None:
+        with backend_lock:
+            if backend is None:
+                if SHEET_BACKEND == "local":
+                    backend = LocalBackend()
+                else:
+                    backend = GspreadBackend()
+    return backend
+
+
+def set_backend(new_backend: SheetBackend):
+    # swap the backend, e.g. for a LocalBackend in benchmarks. spreadsheets
+    # cached from the old backend are dropped.
+    global backend
+    with backend_lock:
+        backend = new_backend
+    sheet_cache.clear()
+    return new_backend
@@ -0,0 +1,111 @@
+# python imports
+import os
+import time
+import bisect
+import threading
+from collections import OrderedDict
+
+SHEET_CACHE_TTL = float(os.getenv("SHEET_CACHE_TTL", 300))
+
+
+# thread safe dict whose entries expire `ttl` seconds after they were set.
+# with `maxsize` the least recently used entry is dropped when it is full.
+class TTLCache(object):
+    def __init__(self, ttl: float, maxsize: int = None) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            if self.maxsize and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# spreadsheets, worksheets and header rows keyed by fee_type and sheet name
+sheet_cache = TTLCache(SHEET_CACHE_TTL)
+
+
+# local mirror of a worksheet's values with lookups from an identifier
+# column (e.g. "Phone No") to the 1-based sheet row it sits on
+class WorksheetRows(object):
+    def __init__(self, rows: list) -> None:
+        self.rows = [[str(value) for value in row] for row in rows]
+        self.header = self.rows[0] if self.rows else []
+        self._lookups = {}
+        # held across read-modify-write cycles that also write to the sheet
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column_index(self, column_name: str):
+        return self.header.index(column_name) if column_name in self.header else None
+
+    def find(self, column_name: str, value):
+        if column_name not in self._lookups:
+            index = self.column_index(column_name)
+            if index is None:
+                return None
+            lookup = {}
+            for row_index, row in enumerate(self.rows[1:], start=2):
+                if index < len(row):
+                    lookup.setdefault(row[index], row_index)
+            self._lookups[column_name] = lookup
+        return self._lookups[column_name].get(str(value))
+
+    def get(self, row_index: int, column_name: str):
+        row = self.rows[row_index - 1]
+        index = self.column_index(column_name)
+        return row[index] if index < len(row) else ""
+
+    def set(self, row_index: int, column_name: str, value):
+        row = self.rows[row_index - 1]
+        index = self.column_index(column_name)
+        row.extend([""] * (index + 1 - len(row)))
+        row[index] = str(value)
+        self._lookups.pop(column_name, None)
+
+    def insert(self, row_index: int, values: list):
+        self.rows.insert(row_index - 1, [str(value) for value in values])
+        self._lookups.clear()
+
+    def sorted_position(self, column_name: str, value):
+        # sheet row that keeps the rows ordered by `column_name` if `value` goes there
+        index = self.column_index(column_name)
+        keys = [sort_key(row, index) for row in self.rows[1:]]
+        return bisect.bisect_right(keys, str(value).casefold()) + 2
+
+    def sort(self, column_name: str):
+        index = self.column_index(column_name)
+        self.rows[1:] = sorted(self.rows[1:], key=lambda row: sort_key(row, index))
+        self._lookups.clear()
+
+
+def sort_key(row: list, index: int):
+    return str(row[index]).casefold() if index < len(row) else ""
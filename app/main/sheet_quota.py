@@ -0,0 +1,103 @@
+# python imports
+import os
+import time
+import random
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# local imports
+from app.metrics import record_sheet_throttle
+
+# google allows 60 requests per minute per user (service account) by default
+SHEETS_REQUESTS_PER_MINUTE = float(os.getenv("SHEETS_REQUESTS_PER_MINUTE", 60))
+SHEETS_BURST = float(os.getenv("SHEETS_BURST", 10))
+# tokens only payment traffic may use, so bulk jobs never starve payments
+SHEETS_PAYMENT_RESERVE = float(os.getenv("SHEETS_PAYMENT_RESERVE", 3))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", 5))
+SHEETS_BACKOFF_BASE = float(os.getenv("SHEETS_BACKOFF_BASE", 1))
+SHEETS_BACKOFF_MAX = float(os.getenv("SHEETS_BACKOFF_MAX", 32))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# lower runs first
+PAYMENT = 0
+BULK = 1
+PRIORITY_NAMES = {PAYMENT: "payment", BULK: "bulk"}
+
+current_priority = ContextVar("sheet_priority", default=PAYMENT)
+
+
+@contextmanager
+def sheet_priority(priority: int):
+    # sheet calls made inside run at `priority`. works as a decorator too.
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+# token bucket shared by every sheet api call. waiting payment calls go
+# before waiting bulk calls, and bulk calls leave `reserve` tokens unused.
+class QuotaScheduler(object):
+    def __init__(
+        self,
+        requests_per_minute: float = SHEETS_REQUESTS_PER_MINUTE,
+        burst: float = SHEETS_BURST,
+        reserve: float = SHEETS_PAYMENT_RESERVE,
+    ) -> None:
+        self.rate = requests_per_minute / 60
+        self.burst = burst
+        self.reserve = min(reserve, burst - 1)
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._waiting = Counter()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: int = None):
+        # block until a token is free for `priority`; returns seconds waited
+        priority = current_priority.get() if priority is None else priority
+        needed = 1 + (self.reserve if priority > PAYMENT else 0)
+        start = time.monotonic()
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    ahead = any(self._waiting[p] for p in range(priority))
+                    if not ahead and self._tokens >= needed:
+                        self._tokens -= 1
+                        break
+                    self._cond.wait(max((needed - self._tokens) / self.rate, 0.01))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+        waited = time.monotonic() - start
+        record_sheet_throttle(PRIORITY_NAMES.get(priority, priority), waited)
+        return waited
+
+
+def backoff_delay(attempt: int, retry_after: str = None):
+    # full jitter exponential backoff, never shorter than a Retry-After header
+    delay = random.uniform(0, min(SHEETS_BACKOFF_MAX, SHEETS_BACKOFF_BASE * 2**attempt))
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, float(retry_after))
+    return delay
+
+
+def is_idempotent(method: str, endpoint: str):
+    # value reads and writes can be repeated safely after a 5xx. appends and
+    # structural batchUpdate requests (insert row, sort) might already have
+    # been applied, and repeating them would add another row.
+    if method.upper() in ("GET", "PUT"):
+        return True
+    return "/values" in endpoint and ":append" not in endpoint
+
+
+scheduler = QuotaScheduler()
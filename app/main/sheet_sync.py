@@ -0,0 +1,163 @@
+# python imports
+import traceback
+from datetime import timedelta
+
+# local imports
+from app import db, logger
+from app.models import SheetUpdates, Members
+from .worker import PeriodicWorker, claim_pending
+from .functions import update_cells, add_records, sort_worksheet
+
+SYNC_BATCH_SIZE = 200
+SYNC_MAX_ATTEMPTS = 5
+# rows left in "processing" longer than this belong to a worker that died
+SYNC_CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def enqueue_total(fee_type: str, sheetname: str, member: Members):
+    # queue a write of the member's total paid. the worker sums it when the
+    # update is applied, so the request that settled the payment doesn't.
+    update = SheetUpdates(
+        action="total",
+        fee_type=fee_type,
+        sheetname=sheetname,
+        identify_col="Phone No",
+        identify_value=member.phone_no,
+        column_name="Paid",
+        value=member.id,
+    )
+    db.session.add(update)
+    return update
+
+
+def enqueue_append(fee_type: str, sheetname: str, data: dict):
+    # queue an add_record for a donation row. the caller commits.
+    update = SheetUpdates(
+        action="append", fee_type=fee_type, sheetname=sheetname, value=data
+    )
+    db.session.add(update)
+    return update
+
+
+def enqueue_sort(fee_type: str, sheetname: str, sort_column: str = "Name"):
+    # queue a full sort of a worksheet after a bulk write. the caller commits.
+    update = SheetUpdates(
+        action="sort", fee_type=fee_type, sheetname=sheetname, value=sort_column
+    )
+    db.session.add(update)
+    return update
+
+
+def retry_later(update: SheetUpdates, error: str):
+    update.attempts += 1
+    update.claim = None
+    update.error = error
+    update.status = "failed" if update.attempts >= SYNC_MAX_ATTEMPTS else "pending"
+
+
+def mark_done(updates: list):
+    # saved at once, so a later step failing doesn't apply these again
+    if not updates:
+        return
+    for update in updates:
+        update.status = "done"
+        update.claim = None
+        update.error = None
+    db.session.commit()
+
+
+def apply_updates(fee_type: str, sheetname: str, updates: list):
+    # each step marks its updates done as soon as it has written them.
+    # nothing queues "replace" or "increment" any more; they are applied
+    # here only to drain rows queued before the switch to totals.
+    cell_updates = [
+        u for u in updates if u.action in ("replace", "increment", "total")
+    ]
+    # a total already includes any payment an increment for the same cell
+    # would add, so it wins
+    totalled = {
+        (u.identify_col, u.identify_value, u.column_name)
+        for u in cell_updates
+        if u.action == "total"
+    }
+    cell_updates = [
+        u
+        for u in cell_updates
+        if u.action != "increment"
+        or (u.identify_col, u.identify_value, u.column_name) not in totalled
+    ]
+    appends = [u for u in updates if u.action == "append"]
+    sorts = {u.get_value() for u in updates if u.action == "sort"}
+    # one grouped query for every member total in the batch
+    member_ids = [u.get_value() for u in cell_updates if u.action == "total"]
+    totals = Members.totals(member_ids, fee_type=fee_type) if member_ids else {}
+    results = []
+    if cell_updates:
+        results = update_cells(
+            fee_type,
+            sheetname,
+            [
+                {
+                    "identify_col": u.identify_col,
+                    "identify_value": u.identify_value,
+                    "column_name": u.column_name,
+                    "value": totals.get(u.get_value(), 0)
+                    if u.action == "total"
+                    else u.get_value(),
+                    "replace": u.action != "increment",
+                }
+                for u in cell_updates
+            ],
+        )
+    # rows not in the sheet yet, e.g. a member added since the roster was
+    # written, are retried like a failed update
+    unresolved = [u for u, result in zip(cell_updates, results) if result is None]
+    for update in unresolved:
+        retry_later(update, "row or column not found in the sheet")
+    # increments a total made redundant are done too
+    mark_done(
+        [
+            u
+            for u in updates
+            if u.action in ("replace", "increment", "total") and u not in unresolved
+        ]
+    )
+    if appends:
+        add_records(
+            [u.get_value() for u in appends],
+            sheetname=sheetname,
+            fee_type=fee_type,
+            donation=True,
+        )
+        mark_done(appends)
+    for sort_column in sorts:
+        sort_worksheet(fee_type, sheetname, sort_column)
+    mark_done([u for u in updates if u.action == "sort"])
+
+
+def process_pending():
+    updates = claim_pending(SheetUpdates, SYNC_BATCH_SIZE, SYNC_CLAIM_TIMEOUT)
+    if not updates:
+        return False
+
+    # group by worksheet so each one gets a single read and a single write
+    groups = {}
+    for update in updates:
+        groups.setdefault((update.fee_type, update.sheetname), []).append(update)
+
+    for (fee_type, sheetname), group in groups.items():
+        try:
+            apply_updates(fee_type, sheetname, group)
+            logger.info(f"SYNCED {len(group)} UPDATES TO {fee_type} {sheetname}")
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            db.session.rollback()
+            for update in group:
+                if update.status != "processing":
+                    continue
+                retry_later(update, str(e))
+    db.session.commit()
+    return len(updates) == SYNC_BATCH_SIZE
+
+
+sync_worker = PeriodicWorker("sheet-sync", process_pending)
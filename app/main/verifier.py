@@ -0,0 +1,154 @@
+# python imports
+import os
+import traceback
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+# installed imports
+import requests
+
+# local imports
+from app import db, logger
+from app.models import Transactions, Members
+from .worker import PeriodicWorker
+from .payments import settle_transaction
+from .sheet_sync import sync_worker
+from .flutterwave import verify_by_reference
+
+# leave checkouts this young to the callback and the webhook
+VERIFY_STALE_AFTER = timedelta(minutes=float(os.getenv("VERIFY_STALE_AFTER", 15)))
+# checkouts flutterwave has never heard of after this long were abandoned
+VERIFY_EXPIRE_AFTER = timedelta(hours=float(os.getenv("VERIFY_EXPIRE_AFTER", 24)))
+# an unresolved checkout is looked up again once this share of its age has
+# passed since the last lookup, so abandoned ones are checked ~16 times, not
+# on every run until they expire
+VERIFY_BACKOFF = float(os.getenv("VERIFY_BACKOFF", 0.25))
+VERIFY_PAGE_SIZE = int(os.getenv("VERIFY_PAGE_SIZE", 100))
+VERIFY_CONCURRENCY = int(os.getenv("VERIFY_CONCURRENCY", 4))
+
+# lookup result when flutterwave couldn't be reached, as opposed to None
+# for a tx_ref it doesn't know
+UNREACHABLE = "unreachable"
+
+
+def lookup(tx_ref: str):
+    # runs in the pool, so no db access here
+    try:
+        return verify_by_reference(tx_ref)
+    except requests.RequestException:
+        logger.error(traceback.format_exc())
+        return UNREACHABLE
+
+
+def is_due(tx: Transactions, now: datetime):
+    # updated_at marks the last lookup that left the row pending
+    if tx.updated_at is None:
+        return True
+    expires = tx.created_at + VERIFY_EXPIRE_AFTER
+    if tx.updated_at < expires <= now:
+        # one last lookup once it is old enough to expire
+        return True
+    return now - tx.updated_at >= (now - tx.created_at) * VERIFY_BACKOFF
+
+
+def apply_results(page: list, results: list, now: datetime):
+    # settle, fail or expire one page of pending transactions in one commit
+    counts = {"settled": 0, "failed": 0, "expired": 0, "unresolved": 0}
+    failed, expired, waiting = [], [], []
+    members = {
+        member.id: member
+        for member in Members.query.filter(
+            Members.id.in_([tx.member_id for tx in page if tx.member_id])
+        )
+    }
+    for tx, data in zip(page, results):
+        if data == UNREACHABLE:
+            counts["unresolved"] += 1
+            continue
+        payment = (data or {}).get("data") or {}
+        found = data and data.get("status") == "success"
+        if found and payment.get("tx_ref") == tx.tx_ref:
+            member = members.get(tx.member_id)
+            if payment.get("status") == "successful" and (member or tx.donation):
+                _, settled = settle_transaction(
+                    tx.tx_ref,
+                    part=tx.part,
+                    fee_type=tx.fee_type,
+                    amount=payment["amount"],
+                    member=member,
+                    flw_tx_id=payment.get("id"),
+                    flw_tx_ref=payment.get("flw_ref"),
+                    donation=tx.donation,
+                    commit=False,
+                )
+                counts["settled"] += settled
+                continue
+            if payment.get("status") == "failed":
+                failed.append(tx.id)
+                continue
+        elif data is None and tx.created_at + VERIFY_EXPIRE_AFTER <= now:
+            expired.append(tx.id)
+            continue
+        waiting.append(tx.id)
+        counts["unresolved"] += 1
+
+    # the status check keeps rows settled meanwhile by a callback or webhook
+    for status, ids in (("failed", failed), ("expired", expired)):
+        if ids:
+            counts[status] = Transactions.query.filter(
+                Transactions.id.in_(ids), Transactions.status == "pending"
+            ).update({"status": status}, synchronize_session=False)
+    if waiting:
+        Transactions.query.filter(
+            Transactions.id.in_(waiting), Transactions.status == "pending"
+        ).update({"updated_at": now}, synchronize_session=False)
+    db.session.commit()
+    return counts
+
+
+def verify_pending():
+    # verify pending transactions older than VERIFY_STALE_AFTER that are due
+    # another lookup, a page at a time, with up to VERIFY_CONCURRENCY lookups
+    # in flight
+    now = datetime.utcnow()
+    totals = {"checked": 0, "settled": 0, "failed": 0, "expired": 0, "unresolved": 0}
+    last_id = 0
+    with ThreadPoolExecutor(
+        max_workers=VERIFY_CONCURRENCY, thread_name_prefix="verifier"
+    ) as pool:
+        while True:
+            page = (
+                Transactions.query.filter(
+                    Transactions.status == "pending",
+                    Transactions.created_at < now - VERIFY_STALE_AFTER,
+                    Transactions.id > last_id,
+                )
+                .order_by(Transactions.id)
+                .limit(VERIFY_PAGE_SIZE)
+                .all()
+            )
+            if not page:
+                break
+            last_id = page[-1].id
+            page = [tx for tx in page if is_due(tx, now)]
+            if not page:
+                continue
+            results = list(pool.map(lookup, [tx.tx_ref for tx in page]))
+            counts = apply_results(page, results, now)
+            totals["checked"] += len(page)
+            for key, value in counts.items():
+                totals[key] += value
+    if totals["settled"]:
+        sync_worker.wake()
+    if totals["checked"]:
+        logger.info(f"VERIFIED PENDING TRANSACTIONS: {totals}")
+    return totals
+
+
+def run_verifier():
+    verify_pending()
+    # the whole backlog is paged through in one run
+    return False
+
+
+verifier_worker = PeriodicWorker("verifier", run_verifier)
@@ -0,0 +1,74 @@
+# python imports
+import uuid
+import threading
+import traceback
+from datetime import datetime
+
+# local imports
+from app import db, logger
+
+
+# runs `task` in a daemon thread every `interval` seconds inside an app context.
+# a truthy return value means more work is waiting, so the task runs again at once.
+class PeriodicWorker(object):
+    def __init__(self, name: str, task, interval: float = 5) -> None:
+        self.name = name
+        self.task = task
+        self.interval = interval
+        self._app = None
+        self._thread = None
+        self._wakeup = threading.Event()
+
+    def start(self, app, interval: float = None):
+        if self._thread and self._thread.is_alive():
+            return
+        self._app = app
+        if interval is not None:
+            self.interval = interval
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info(f"Started {self.name} worker every {self.interval}s")
+
+    def wake(self):
+        self._wakeup.set()
+
+    def run_once(self):
+        with self._app.app_context():
+            return self.task()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                while self.run_once():
+                    pass
+            except Exception:
+                logger.error(traceback.format_exc())
+
+
+def claim_pending(model, limit: int, timeout):
+    # mark up to `limit` pending rows of `model` as processing and return them.
+    # rows left processing for longer than `timeout` belong to a dead worker.
+    stale = datetime.utcnow() - timeout
+    waiting = db.or_(
+        model.status == "pending",
+        db.and_(model.status == "processing", model.updated_at < stale),
+    )
+    ids = [
+        row.id
+        for row in db.session.query(model.id)
+        .filter(waiting)
+        .order_by(model.id)
+        .limit(limit)
+    ]
+    if not ids:
+        return []
+    # the conditional update makes the claim safe across processes
+    claim = uuid.uuid4().hex
+    db.session.query(model).filter(model.id.in_(ids), waiting).update(
+        {"status": "processing", "claim": claim, "updated_at": datetime.utcnow()},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return model.query.filter(model.claim == claim).order_by(model.id).all()
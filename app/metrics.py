@@ -0,0 +1,276 @@
+# python imports
+import time
+import threading
+
+# installed imports
+from flask import Response, g, request, has_request_context
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# latency buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+registry = []
+
+
+# in-process metrics rendered in the prometheus text format. each worker
+# process keeps its own values, so every process has to be scraped.
+class Metric(object):
+    kind = None
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.extend(self.samples(dict(labels), value))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self, labels: dict, value):
+        return [f"{self.name}{format_labels(labels)} {value}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets=BUCKETS) -> None:
+        super().__init__(name, documentation)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = label_key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(
+                key, ((0,) * len(self.buckets), 0, 0)
+            )
+            counts = tuple(
+                bucket_count + (value <= bucket)
+                for bucket_count, bucket in zip(counts, self.buckets)
+            )
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self, labels: dict, value):
+        counts, total, count = value
+        buckets = list(zip(self.buckets, counts)) + [("+Inf", count)]
+        lines = [
+            f"{self.name}_bucket{format_labels({**labels, 'le': bucket})} {hits}"
+            for bucket, hits in buckets
+        ]
+        lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+        lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+def label_key(labels: dict):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(labels: dict):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in sorted(labels.items())
+    )
+    return "{" + pairs + "}"
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+request_duration = Histogram(
+    "autopay_request_duration_seconds", "Time spent handling requests."
+)
+db_queries = Counter("autopay_db_queries_total", "Database queries executed.")
+db_seconds = Counter("autopay_db_query_seconds_total", "Time spent in db queries.")
+db_errors = Counter("autopay_db_errors_total", "Database queries that failed.")
+http_requests = Counter(
+    "autopay_http_requests_total", "Outbound HTTP requests by final status."
+)
+http_seconds = Counter(
+    "autopay_http_request_seconds_total", "Time spent in outbound HTTP requests."
+)
+http_retries = Counter(
+    "autopay_http_retries_total", "Outbound HTTP attempts that were retried."
+)
+sheet_calls = Counter("autopay_sheet_calls_total", "Google Sheets api calls.")
+sheet_seconds = Counter(
+    "autopay_sheet_call_seconds_total", "Time spent in Google Sheets api calls."
+)
+sheet_errors = Counter(
+    "autopay_sheet_errors_total", "Google Sheets api calls that failed."
+)
+sheet_retries = Counter(
+    "autopay_sheet_retries_total", "Google Sheets api calls retried after 429 or 5xx."
+)
+sheet_throttle_seconds = Counter(
+    "autopay_sheet_throttle_seconds_total", "Time sheet calls waited for quota."
+)
+
+
+def current_route():
+    # metrics recorded outside a request come from the background workers
+    if not has_request_context():
+        return "background"
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def tally(kind: str, seconds: float):
+    # per request totals for the Server-Timing header
+    if has_request_context() and "metrics" in g:
+        count, total = g.metrics.get(kind, (0, 0))
+        g.metrics[kind] = (count + 1, total + seconds)
+
+
+def record_db_query(seconds: float, failed=False):
+    route = current_route()
+    db_queries.inc(route=route)
+    db_seconds.inc(seconds, route=route)
+    if failed:
+        db_errors.inc(route=route)
+    tally("db", seconds)
+
+
+def record_http(service: str, status, seconds: float, retries: int = 0):
+    route = current_route()
+    http_requests.inc(service=service, status=status, route=route)
+    http_seconds.inc(seconds, service=service, route=route)
+    if retries:
+        http_retries.inc(retries, service=service, route=route)
+    tally(service, seconds)
+
+
+def record_sheet_call(call: str, seconds: float, failed=False):
+    route = current_route()
+    sheet_calls.inc(call=call, route=route)
+    sheet_seconds.inc(seconds, route=route)
+    if failed:
+        sheet_errors.inc(call=call, route=route)
+    tally("sheets", seconds)
+
+
+def record_sheet_retry(status: int):
+    sheet_retries.inc(status=status, route=current_route())
+
+
+def record_sheet_throttle(priority: str, seconds: float):
+    sheet_throttle_seconds.inc(seconds, priority=priority, route=current_route())
+    if seconds:
+        tally("quota", seconds)
+
+
+# HTTPAdapter that records each request to `service` once, after retries
+class InstrumentedAdapter(HTTPAdapter):
+    def __init__(self, service: str, *args, **kwargs) -> None:
+        self.service = service
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = super().send(request, *args, **kwargs)
+        except Exception as e:
+            # requests wraps the urllib3 error raised once retries ran out
+            cause = e.args[0] if e.args else None
+            record_http(
+                self.service,
+                "error",
+                time.perf_counter() - start,
+                self.max_retries.total if isinstance(cause, MaxRetryError) else 0,
+            )
+            raise
+        retries = getattr(response.raw, "retries", None)
+        record_http(
+            self.service,
+            response.status_code,
+            time.perf_counter() - start,
+            len(retries.history) if retries else 0,
+        )
+        return response
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_db_query(time.perf_counter() - conn.info["query_start"].pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def handle_error(context):
+    starts = context.connection.info.get("query_start") if context.connection else None
+    if starts:
+        record_db_query(time.perf_counter() - starts.pop(), failed=True)
+
+
+def init_app(app):
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics = {}
+
+    @app.after_request
+    def record_request(response):
+        if "metrics_start" not in g:
+            return response
+        start = g.metrics_start
+        labels = {
+            "route": current_route(),
+            "method": request.method,
+            "status": response.status_code,
+        }
+        if response.is_streamed:
+            # streamed bodies (exports) are generated after this returns, so
+            # they are timed when the server closes the response. the
+            # headers are already sent by then, so no Server-Timing.
+            response.call_on_close(
+                lambda: request_duration.observe(
+                    time.perf_counter() - start, **labels
+                )
+            )
+            return response
+        elapsed = time.perf_counter() - start
+        request_duration.observe(elapsed, **labels)
+        if app.config.get("SERVER_TIMING"):
+            timings = [
+                f'{kind};dur={total * 1000:.1f};desc="{count} calls"'
+                for kind, (count, total) in g.metrics.items()
+            ]
+            timings.append(f"total;dur={elapsed * 1000:.1f}")
+            response.headers["Server-Timing"] = ", ".join(timings)
+        return response
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -1,4 +1,5 @@
 # python imports
+import json
 import uuid
 import time
 from datetime import datetime
@@ -34,8 +35,8 @@ class Members(db.Model, TimestampMixin, DatabaseHelperMixin):
     __tablename__ = "member"
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(200), nullable=False)
-    part = db.Column(db.String(10), nullable=False)
+    name = db.Column(db.String(200), nullable=False, index=True)
+    part = db.Column(db.String(10), nullable=False, index=True)
     phone_no = db.Column(db.String(20), unique=True)
 
     def __init__(self, name: str, part: str, phone_no: str) -> None:
@@ -48,20 +49,37 @@ class Members(db.Model, TimestampMixin, DatabaseHelperMixin):
             Transactions.member_id == self.id, Transactions.status == "completed"
         ).all()
 
-    def amount(self):
-        return sum(
-            [
-                tx.amount
-                for tx in Transactions.query.filter(
-                    Transactions.member_id == self.id,
-                    Transactions.status == "completed",
-                ).all()
-            ]
+    def amount(self, fee_type: str = None):
+        query = db.session.query(db.func.sum(Transactions.amount)).filter(
+            Transactions.member_id == self.id,
+            Transactions.status == "completed",
         )
+        if fee_type:
+            query = query.filter(Transactions.fee_type == fee_type)
+        return int(query.scalar() or 0)
+
+    @staticmethod
+    def totals(member_ids: list = None, fee_type: str = None):
+        # {member id: amount paid} for many members in one grouped query
+        query = db.session.query(
+            Transactions.member_id, db.func.sum(Transactions.amount)
+        ).filter(
+            Transactions.member_id.isnot(None),
+            Transactions.status == "completed",
+        )
+        if member_ids is not None:
+            query = query.filter(Transactions.member_id.in_(member_ids))
+        if fee_type:
+            query = query.filter(Transactions.fee_type == fee_type)
+        query = query.group_by(Transactions.member_id)
+        return {member_id: int(total or 0) for member_id, total in query}
 
 
 class Transactions(db.Model, TimestampMixin, DatabaseHelperMixin):
     __tablename__ = "transaction"
+    __table_args__ = (
+        db.Index("ix_transaction_member_id_status", "member_id", "status"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     status = db.Column(db.String(20), default="pending")
@@ -70,7 +88,7 @@ class Transactions(db.Model, TimestampMixin, DatabaseHelperMixin):
     fee_type = db.Column(db.String(50), nullable=False)
     amount = db.Column(db.Integer, nullable=False)
     donation = db.Column(db.Boolean, default=False)
-    tx_ref = db.Column(db.String(100), nullable=False)
+    tx_ref = db.Column(db.String(100), unique=True, nullable=False, index=True)
     flw_tx_id = db.Column(db.String(100))
     flw_tx_ref = db.Column(db.String(100))
     member_id = db.Column(db.ForeignKey("member.id"))
@@ -88,4 +106,103 @@ class Transactions(db.Model, TimestampMixin, DatabaseHelperMixin):
 
     @staticmethod
     def get_tx_ref(part: str):
-        return f"{part.lower()}-{str(time.time()).split('.')[0]}"
+        # tx_ref is unique, so add a random suffix to refs made in the same second
+        return f"{part.lower()}-{str(time.time()).split('.')[0]}-{uuid.uuid4().hex[:6]}"
+
+
+class SheetUpdates(db.Model, TimestampMixin, DatabaseHelperMixin):
+    __tablename__ = "sheet_update"
+
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), default="pending", index=True)
+    # replace, increment, total, append or sort
+    action = db.Column(db.String(20), nullable=False)
+    fee_type = db.Column(db.String(50), nullable=False)
+    sheetname = db.Column(db.String(50), nullable=False)
+    identify_col = db.Column(db.String(50))
+    identify_value = db.Column(db.String(100))
+    column_name = db.Column(db.String(50))
+    value = db.Column(db.Text, nullable=False)  # json encoded
+    attempts = db.Column(db.Integer, default=0)
+    claim = db.Column(db.String(32))
+    error = db.Column(db.Text)
+
+    def __init__(
+        self,
+        action,
+        fee_type,
+        sheetname,
+        value,
+        identify_col=None,
+        identify_value=None,
+        column_name=None,
+    ) -> None:
+        self.action = action
+        self.fee_type = fee_type
+        self.sheetname = sheetname
+        self.value = json.dumps(value)
+        self.identify_col = identify_col
+        self.identify_value = identify_value
+        self.column_name = column_name
+        self.attempts = 0
+
+    def get_value(self):
+        return json.loads(self.value)
+
+
+class WebhookEvents(db.Model, TimestampMixin, DatabaseHelperMixin):
+    __tablename__ = "webhook_event"
+
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), default="pending", index=True)
+    tx_ref = db.Column(db.String(100))
+    payload = db.Column(db.Text, nullable=False)  # raw json body
+    result = db.Column(db.String(20))
+    attempts = db.Column(db.Integer, default=0)
+    claim = db.Column(db.String(32))
+    error = db.Column(db.Text)
+
+    def __init__(self, payload: str) -> None:
+        self.payload = payload
+        self.tx_ref = (json.loads(payload).get("data") or {}).get("tx_ref")
+        self.attempts = 0
+
+    def get_payload(self):
+        return json.loads(self.payload)
+
+
+class PaymentRollups(db.Model, TimestampMixin, DatabaseHelperMixin):
+    # completed payments summed per fee type, part and day. kept up to date
+    # by settlement; rebuild with `flask rebuild-rollups`.
+    __tablename__ = "payment_rollup"
+    __table_args__ = (
+        db.UniqueConstraint("fee_type", "part", "day", name="uq_payment_rollup_key"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    fee_type = db.Column(db.String(50), nullable=False)
+    part = db.Column(db.String(10), nullable=False)  # lower case
+    day = db.Column(db.Date, nullable=False)
+    total = db.Column(db.BigInteger, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    donation_total = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __init__(self, fee_type, part, day, total=0, count=0, donation_total=0):
+        self.fee_type = fee_type
+        self.part = part
+        self.day = day
+        self.total = total
+        self.count = count
+        self.donation_total = donation_total
+
+
+class MemberTerms(db.Model):
+    # normalized search terms of a member's name: the whole name, each token
+    # and each token's trigrams. maintained by app.main.search.
+    __tablename__ = "member_term"
+    __table_args__ = (db.Index("ix_member_term_kind_term", "kind", "term"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    member_id = db.Column(db.ForeignKey("member.id"), nullable=False, index=True)
+    kind = db.Column(db.String(10), nullable=False)  # name, token or trigram
+    term = db.Column(db.String(200), nullable=False)
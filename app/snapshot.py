@@ -0,0 +1,30 @@
+# python imports
+import os
+import time
+import threading
+
+
+# value loaded from a file or directory and reloaded only when its mtime
+# changes. the mtime is checked at most once every `interval` seconds, and a
+# reload swaps in a new value rather than changing the old one in place.
+class FileSnapshot(object):
+    def __init__(self, path: str, loader, interval: float = 2) -> None:
+        self.path = path
+        self.loader = loader
+        self.interval = interval
+        self._value = None
+        self._mtime = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self._checked is None or now - self._checked >= self.interval:
+            with self._lock:
+                if self._checked is None or now - self._checked >= self.interval:
+                    mtime = os.stat(self.path).st_mtime_ns
+                    if mtime != self._mtime:
+                        self._value = self.loader(self.path)
+                        self._mtime = mtime
+                    self._checked = now
+        return self._value
@@ -184,6 +184,7 @@ document.getElementById("adminForm").addEventListener("submit", async (e) => {
       if (response.ok) {
         mssg.innerText = "Added successfully!";
         mssg.hidden = false;
+        await getTotals();
       } else {
         alert("Failed to add payment. Please refresh the page and try again.");
         let error = await response.json();
@@ -201,7 +202,41 @@ document.getElementById("adminForm").addEventListener("submit", async (e) => {
   }
 });
 
+const getTotals = async () => {
+  const fee_type = document.getElementById("fee_type").value;
+  const totalsDiv = document.getElementById("totals");
+  try {
+    let response = await fetch(`/admin/totals?fee_type=${fee_type}`);
+    if (!response.ok) {
+      console.log(await response.json());
+      return;
+    }
+    let data = await response.json();
+    const summary = data.totals[fee_type];
+    if (!summary) {
+      totalsDiv.innerText = "No payments yet.";
+      return;
+    }
+    const lines = [
+      `Total: ₦${summary.total.toLocaleString()} from ${summary.count} payments` +
+        ` (donations ₦${summary.donation_total.toLocaleString()})`,
+    ];
+    Object.entries(summary.parts).forEach(([part, totals]) => {
+      if (!part) return;
+      lines.push(
+        `${part[0].toUpperCase()}${part.slice(1)}: ₦${totals.total.toLocaleString()}` +
+          ` (${totals.count})`
+      );
+    });
+    totalsDiv.innerText = lines.join("\n");
+  } catch (error) {
+    console.log(error);
+  }
+};
+
 document.getElementById("part").addEventListener("change", getNames);
 document.getElementById("fee_type").addEventListener("change", getNames);
+document.getElementById("fee_type").addEventListener("change", getTotals);
 document.addEventListener("DOMContentLoaded", getNames);
+document.addEventListener("DOMContentLoaded", getTotals);
 document.getElementById("name").removeEventListener("input", handleInput);
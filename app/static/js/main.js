@@ -1,20 +1,37 @@
 var names = [];
 var donate = false;
+var searchTimer = null;
 
-const handleInput = () => {
-  // Get the input value
-  const input = document.getElementById("name").value.toLowerCase();
-
-  // Filter the data based on the input
-  const checkNames = names.map((name) => name[0]);
-  const filteredData = input
-    ? checkNames.filter(function (item) {
-        return item.toLowerCase().includes(input);
-      })
-    : [];
+const searchNames = async () => {
+  const input = document.getElementById("name").value;
+  const part = document.getElementById("part").value;
+  if (!input.trim()) {
+    names = [];
+    displayAutocompleteItems([]);
+    return;
+  }
+  try {
+    const params = new URLSearchParams({ q: input, part, per_page: 10 });
+    let response = await fetch(`/members/search?${params}`);
+    if (response.ok) {
+      let data = await response.json();
+      // ignore results for text the payer has since changed
+      if (input !== document.getElementById("name").value) return;
+      names = data.results.map((result) => [result.name]);
+      displayAutocompleteItems(names.map((name) => name[0]));
+    } else {
+      let error = await response.json();
+      console.log(error);
+    }
+  } catch (error) {
+    console.log(error);
+  }
+};
 
-  // Display the filtered data as autocomplete items
-  displayAutocompleteItems(filteredData);
+const handleInput = () => {
+  // search once the payer pauses typing
+  clearTimeout(searchTimer);
+  searchTimer = setTimeout(searchNames, 250);
 };
 
 const displayAutocompleteItems = (items) => {
@@ -66,7 +83,7 @@ document.getElementById("paymentForm").addEventListener("submit", async (e) => {
     const name = document.getElementById("name").value;
     const amount = document.getElementById("amount").value;
     const fee_type = document.getElementById("fee_type").value;
-    let payload = { part, name };
+    let payload = { part, name, fee_type, amount };
     let response = await fetch("/tx_ref", {
       method: "POST",
       headers: {
@@ -108,31 +125,12 @@ document.getElementById("paymentForm").addEventListener("submit", async (e) => {
   }
 });
 
-const getNames = async () => {
-  const nameDiv = document.getElementById("name-div");
+const getNames = () => {
+  // names are searched as the payer types; start over for the new part
   document.getElementById("name").value = "";
-  try {
-    nameDiv.classList.toggle("running");
-    const part = document.getElementById("part").value;
-    const fee_type = document.getElementById("fee_type").value;
-    let response = await fetch(`/names?part=${part}&fee_type=${fee_type}`);
-    if (response.ok) {
-      let data = await response.json();
-      if (data.names) {
-        names = data.names;
-        document.getElementById("name").disabled = false;
-      }
-    } else {
-      alert("Error getting parts. Try refreshing the page");
-      let error = await response.json();
-      console.log(error);
-    }
-  } catch (error) {
-    alert("An error occured. Please try again later or contact the admins.");
-    console.log(error);
-  } finally {
-    nameDiv.classList.toggle("running");
-  }
+  document.getElementById("name").disabled = false;
+  names = [];
+  displayAutocompleteItems([]);
 };
 
 // document.getElementById("donate").addEventListener("change", (e) => {
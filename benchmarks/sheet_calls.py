@@ -0,0 +1,157 @@
+"""Sheet API calls and wall time per operation, against the local backend.
+
+Run from the repository root:
+
+    python -m benchmarks.sheet_calls
+    python -m benchmarks.sheet_calls --sizes 100 1000 --latency 0.05 --json
+
+Calls are counted per operation; add_record and find_and_replace are averaged
+over --repeat calls, both with a warm sheet cache and a cold one (cold is what
+the first payment after a restart or cache expiry costs).
+"""
+# python imports
+import io
+import json
+import time
+import argparse
+
+# installed imports
+import openpyxl
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+# local imports
+from app import db
+from app.models import Members
+from app.main import functions
+from app.main.functions import (
+    PART_SHEETNAMES,
+    add_record,
+    find_and_replace,
+    file_upload,
+    populate_sheet,
+)
+from app.main.sheet_cache import sheet_cache
+from app.main.sheet_backend import LocalBackend, set_backend
+
+FEE_TYPE = "fusion-cantus"
+
+
+def make_app():
+    app = Flask("benchmark")
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
+
+
+def seed_members(size: int):
+    db.drop_all()
+    db.create_all()
+    db.session.add_all(
+        [
+            Members(
+                f"Member {i:05d}",
+                PART_SHEETNAMES[i % len(PART_SHEETNAMES)].lower(),
+                f"080{i:08d}",
+            )
+            for i in range(size)
+        ]
+    )
+    db.session.commit()
+
+
+def make_upload(size: int):
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for part_index, sheetname in enumerate(PART_SHEETNAMES):
+        sheet = workbook.create_sheet(sheetname)
+        sheet.append(["Name", "Phone No", "Paid"])
+        for i in range(part_index, size, len(PART_SHEETNAMES)):
+            sheet.append([f"Member {i:05d}", f"080{i:08d}", i % 7 * 1000])
+    file = io.BytesIO()
+    workbook.save(file)
+    file.seek(0)
+    return FileStorage(stream=file, filename="upload.xlsx")
+
+
+def measure(backend: LocalBackend, operation, repeat: int = 1, cold=False):
+    calls = elapsed = 0
+    for i in range(repeat):
+        if cold:
+            sheet_cache.clear()
+        backend.reset_calls()
+        start = time.perf_counter()
+        operation(i)
+        elapsed += time.perf_counter() - start
+        calls += backend.total_calls
+    return {"calls": calls / repeat, "ms": elapsed / repeat * 1000}
+
+
+def run(size: int, latency: float, repeat: int):
+    backend = set_backend(LocalBackend(latency=latency))
+    functions.sheets = {FEE_TYPE: "benchmark"}
+    seed_members(size)
+    results = {}
+
+    results["populate_sheet"] = measure(backend, lambda i: populate_sheet(FEE_TYPE))
+
+    def new_record(i):
+        add_record(
+            {"Name": f"New {i}", "Phone No": f"090{time.time_ns()}", "Paid": 0},
+            sheetname="Soprano",
+            fee_type=FEE_TYPE,
+        )
+
+    def payment(i):
+        find_and_replace(
+            FEE_TYPE,
+            identify_value=f"080{i * len(PART_SHEETNAMES):08d}",
+            new_value=1000,
+            identify_col="Phone No",
+            column_name="Paid",
+            sheetname="Soprano",
+            replace=False,
+        )
+
+    results["add_record"] = measure(backend, new_record, repeat)
+    results["add_record (cold)"] = measure(backend, new_record, repeat, cold=True)
+    results["find_and_replace"] = measure(backend, payment, repeat)
+    results["find_and_replace (cold)"] = measure(backend, payment, repeat, cold=True)
+
+    upload = make_upload(size)
+    results["file_upload"] = measure(
+        backend, lambda i: file_upload(upload, FEE_TYPE), cold=True
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument(
+        "--latency", type=float, default=0, help="seconds added to each api call"
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    args = parser.parse_args()
+
+    app = make_app()
+    report = {}
+    with app.app_context():
+        for size in args.sizes:
+            report[size] = run(size, args.latency, args.repeat)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{'operation':<26}{'roster':>8}{'api calls':>12}{'wall ms':>12}")
+    for size, results in report.items():
+        for operation, result in results.items():
+            print(
+                f"{operation:<26}{size:>8}{result['calls']:>12.1f}{result['ms']:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,31 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def database_url():
+    # plain mysql:// urls use PyMySQL. it is pure python, so gevent makes its
+    # queries and lock waits cooperative; the mysqlclient C driver would block
+    # every request in the worker while one waits on the database.
+    url = os.environ.get("DATABASE_URL")
+    if url and url.startswith("mysql://"):
+        url = "mysql+pymysql://" + url[len("mysql://") :]
+    return url
+
+
 class Config(object):
     # key for CSF
     SECRET_KEY = os.environ.get("SECRET_KEY")
     # sqlalchemy .db location (for sqlite)
-    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL")
+    SQLALCHEMY_DATABASE_URI = database_url()
     # sqlalchemy track modifications in sqlalchemy
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECURITY_PASSWORD_SALT = os.environ.get("SECURITY_PASSWORD_SALT")
     # app
     SERVER_NAME = os.environ.get("SERVER_NAME")
     PREFERRED_URL_SCHEME = "https"
+    # background workers (google sheets sync, webhook processing)
+    BACKGROUND_WORKERS = os.environ.get("BACKGROUND_WORKERS", "1") == "1"
+    SHEET_SYNC_INTERVAL = float(os.environ.get("SHEET_SYNC_INTERVAL", 5))
+    WEBHOOK_INTERVAL = float(os.environ.get("WEBHOOK_INTERVAL", 5))
+    VERIFY_INTERVAL = float(os.environ.get("VERIFY_INTERVAL", 300))
+    # add a Server-Timing header with db, http and sheets time to each response
+    SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
@@ -0,0 +1,41 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+import os
+import sys
+import subprocess
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 4000)}"
+
+# gevent workers make blocking sockets cooperative, so a request waiting on
+# flutterwave, google or mysql (through PyMySQL, see config.py) yields to
+# other requests instead of holding a thread.
+# one worker serves many concurrent payers; each worker also runs its own
+# background workers and sheets quota, so keep the count low.
+worker_class = "gevent"
+workers = int(os.getenv("GUNICORN_WORKERS", 1))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 500))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # run migrations in a subprocess so the master never imports the app
+    # before gevent has patched the standard library in the workers
+    subprocess.run(
+        [sys.executable, "-m", "flask", "--app", "wsgi", "db", "upgrade"], check=True
+    )
+
+
+def post_worker_init(worker):
+    # background workers run only in serving processes, never in the master
+    # or in cli commands that import the app
+    from app import start_workers
+
+    start_workers(worker.wsgi)
@@ -0,0 +1,160 @@
+"""initial schema and lookup indexes
+
+Brings a database created by db.create_all() up to the current schema
+without a rebuild: missing tables are created and missing indexes are
+added to existing ones. Fresh databases get everything.
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-05-02 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def timestamps():
+    return [
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    ]
+
+
+def create_index(inspector, name, table, columns, unique=False):
+    if name not in [index["name"] for index in inspector.get_indexes(table)]:
+        op.create_index(name, table, columns, unique=unique)
+
+
+def dedupe_tx_refs(bind):
+    # tx_ref becomes unique. refs that were recorded twice (webhook and
+    # callback racing) are one payment, so the oldest row keeps it; later
+    # rows get an id suffix and the "duplicate" status, which keeps them out
+    # of every completed total.
+    transaction = sa.table(
+        "transaction",
+        sa.column("id", sa.Integer),
+        sa.column("tx_ref", sa.String),
+        sa.column("status", sa.String),
+    )
+    duplicates = bind.execute(
+        sa.select(transaction.c.tx_ref)
+        .group_by(transaction.c.tx_ref)
+        .having(sa.func.count() > 1)
+    ).scalars()
+    for tx_ref in list(duplicates):
+        ids = bind.execute(
+            sa.select(transaction.c.id)
+            .where(transaction.c.tx_ref == tx_ref)
+            .order_by(transaction.c.id)
+        ).scalars()
+        for tx_id in list(ids)[1:]:
+            bind.execute(
+                transaction.update()
+                .where(transaction.c.id == tx_id)
+                .values(tx_ref=f"{tx_ref}-dup{tx_id}", status="duplicate")
+            )
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = inspector.get_table_names()
+
+    if "member" not in tables:
+        op.create_table(
+            "member",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("name", sa.String(length=200), nullable=False),
+            sa.Column("part", sa.String(length=10), nullable=False),
+            sa.Column("phone_no", sa.String(length=20), nullable=True),
+            *timestamps(),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("phone_no"),
+        )
+    create_index(inspector, "ix_member_name", "member", ["name"])
+    create_index(inspector, "ix_member_part", "member", ["part"])
+
+    if "transaction" not in tables:
+        op.create_table(
+            "transaction",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("status", sa.String(length=20), nullable=True),
+            sa.Column("uid", sa.String(length=200), nullable=False),
+            sa.Column("part", sa.String(length=10), nullable=True),
+            sa.Column("fee_type", sa.String(length=50), nullable=False),
+            sa.Column("amount", sa.Integer(), nullable=False),
+            sa.Column("donation", sa.Boolean(), nullable=True),
+            sa.Column("tx_ref", sa.String(length=100), nullable=False),
+            sa.Column("flw_tx_id", sa.String(length=100), nullable=True),
+            sa.Column("flw_tx_ref", sa.String(length=100), nullable=True),
+            sa.Column("member_id", sa.Integer(), nullable=True),
+            *timestamps(),
+            sa.ForeignKeyConstraint(["member_id"], ["member.id"]),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("uid"),
+        )
+    else:
+        dedupe_tx_refs(bind)
+    create_index(
+        inspector, "ix_transaction_tx_ref", "transaction", ["tx_ref"], unique=True
+    )
+    create_index(
+        inspector,
+        "ix_transaction_member_id_status",
+        "transaction",
+        ["member_id", "status"],
+    )
+
+    if "sheet_update" not in tables:
+        op.create_table(
+            "sheet_update",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("status", sa.String(length=20), nullable=True),
+            sa.Column("action", sa.String(length=20), nullable=False),
+            sa.Column("fee_type", sa.String(length=50), nullable=False),
+            sa.Column("sheetname", sa.String(length=50), nullable=False),
+            sa.Column("identify_col", sa.String(length=50), nullable=True),
+            sa.Column("identify_value", sa.String(length=100), nullable=True),
+            sa.Column("column_name", sa.String(length=50), nullable=True),
+            sa.Column("value", sa.Text(), nullable=False),
+            sa.Column("attempts", sa.Integer(), nullable=True),
+            sa.Column("claim", sa.String(length=32), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+            *timestamps(),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    create_index(inspector, "ix_sheet_update_status", "sheet_update", ["status"])
+
+    if "webhook_event" not in tables:
+        op.create_table(
+            "webhook_event",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("status", sa.String(length=20), nullable=True),
+            sa.Column("tx_ref", sa.String(length=100), nullable=True),
+            sa.Column("payload", sa.Text(), nullable=False),
+            sa.Column("result", sa.String(length=20), nullable=True),
+            sa.Column("attempts", sa.Integer(), nullable=True),
+            sa.Column("claim", sa.String(length=32), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+            *timestamps(),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    create_index(inspector, "ix_webhook_event_status", "webhook_event", ["status"])
+
+
+def downgrade():
+    op.drop_index("ix_webhook_event_status", table_name="webhook_event")
+    op.drop_table("webhook_event")
+    op.drop_index("ix_sheet_update_status", table_name="sheet_update")
+    op.drop_table("sheet_update")
+    op.drop_index("ix_transaction_member_id_status", table_name="transaction")
+    op.drop_index("ix_transaction_tx_ref", table_name="transaction")
+    op.drop_index("ix_member_part", table_name="member")
+    op.drop_index("ix_member_name", table_name="member")
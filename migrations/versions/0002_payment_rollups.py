@@ -0,0 +1,103 @@
+"""payment rollups
+
+Adds the payment_rollup table behind the admin totals and fills it from
+the completed transactions already recorded.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-05-20 10:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def backfill(bind):
+    transaction = sa.table(
+        "transaction",
+        sa.column("status", sa.String),
+        sa.column("part", sa.String),
+        sa.column("fee_type", sa.String),
+        sa.column("amount", sa.Integer),
+        sa.column("donation", sa.Boolean),
+        sa.column("created_at", sa.DateTime),
+    )
+    rollup = sa.table(
+        "payment_rollup",
+        sa.column("fee_type", sa.String),
+        sa.column("part", sa.String),
+        sa.column("day", sa.Date),
+        sa.column("total", sa.BigInteger),
+        sa.column("count", sa.Integer),
+        sa.column("donation_total", sa.BigInteger),
+        sa.column("created_at", sa.DateTime),
+    )
+    day = sa.func.date(transaction.c.created_at)
+    part = sa.func.coalesce(sa.func.lower(transaction.c.part), "")
+    grouped = (
+        sa.select(
+            transaction.c.fee_type,
+            part,
+            day,
+            sa.func.sum(transaction.c.amount),
+            sa.func.count(),
+            sa.func.sum(
+                sa.case(
+                    (transaction.c.donation == sa.true(), transaction.c.amount),
+                    else_=0,
+                )
+            ),
+            sa.literal(datetime.utcnow()),
+        )
+        .where(transaction.c.status == "completed")
+        .group_by(transaction.c.fee_type, part, day)
+    )
+    bind.execute(
+        rollup.insert().from_select(
+            [
+                "fee_type",
+                "part",
+                "day",
+                "total",
+                "count",
+                "donation_total",
+                "created_at",
+            ],
+            grouped,
+        )
+    )
+
+
+def upgrade():
+    bind = op.get_bind()
+    if "payment_rollup" in sa.inspect(bind).get_table_names():
+        return
+
+    op.create_table(
+        "payment_rollup",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("fee_type", sa.String(length=50), nullable=False),
+        sa.Column("part", sa.String(length=10), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("total", sa.BigInteger(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("donation_total", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("fee_type", "part", "day", name="uq_payment_rollup_key"),
+    )
+    backfill(bind)
+
+
+def downgrade():
+    op.drop_table("payment_rollup")
@@ -0,0 +1,64 @@
+"""member name search terms
+
+Adds the member_term table behind /members/search and webhook name
+resolution, and indexes the members already recorded.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-06-03 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def backfill(bind):
+    # the same terms the app builds when members are added
+    from app.main.search import name_terms
+
+    member = sa.table("member", sa.column("id", sa.Integer), sa.column("name", sa.String))
+    member_term = sa.table(
+        "member_term",
+        sa.column("member_id", sa.Integer),
+        sa.column("kind", sa.String),
+        sa.column("term", sa.String),
+    )
+    rows = [
+        {"member_id": member_id, "kind": kind, "term": term}
+        for member_id, name in bind.execute(sa.select(member.c.id, member.c.name))
+        for kind, term in name_terms(name)
+    ]
+    if rows:
+        bind.execute(member_term.insert(), rows)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if "member_term" in sa.inspect(bind).get_table_names():
+        return
+
+    op.create_table(
+        "member_term",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("member_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=10), nullable=False),
+        sa.Column("term", sa.String(length=200), nullable=False),
+        sa.ForeignKeyConstraint(["member_id"], ["member.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_member_term_member_id", "member_term", ["member_id"])
+    op.create_index("ix_member_term_kind_term", "member_term", ["kind", "term"])
+    backfill(bind)
+
+
+def downgrade():
+    op.drop_index("ix_member_term_kind_term", table_name="member_term")
+    op.drop_index("ix_member_term_member_id", table_name="member_term")
+    op.drop_table("member_term")
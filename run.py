@@ -1,15 +1,19 @@
 import os
 from dotenv import load_dotenv
-from app import create_app, db
-from app.main.functions import populate_db
+from flask_migrate import upgrade
+from app import create_app, start_workers
 
 load_dotenv()
 
 app = create_app()
 
-with app.app_context():
-    db.create_all()
-    populate_db()
-
 if __name__ == "__main__":
+    # the reloader runs this file twice; the parent migrates once and only
+    # the child serves requests. flask commands import this module without
+    # touching the schema.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_workers(app)
+    else:
+        with app.app_context():
+            upgrade()
     app.run(debug=True, host=os.getenv("SERVER_NAME"), port=4000)
@@ -0,0 +1,9 @@
+from dotenv import load_dotenv
+from app import create_app
+
+load_dotenv()
+
+# production entry point, served by gunicorn with gunicorn.conf.py.
+# migrations are applied by the gunicorn master before workers start, and
+# each worker starts its background workers in post_worker_init.
+app = create_app()